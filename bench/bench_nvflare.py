@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import logging
+
+logging.basicConfig(
+    format='%(asctime)s | %(name)s | %(levelname)s : %(message)s',
+    level=logging.INFO,
+    stream=sys.stdout
+)
+logger = logging.getLogger('bench-nvflare')
+
+import argparse
+import json
+import shlex
+import subprocess
+import tempfile
+import time
+
+from mock_server import MockServer, make_jwt
+
+TOOL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tool_nvflare.py')
+
+# stands in for the docker CLI with --start: containers are only recorded, `docker run` arguments in docker-runs.jsonl
+STUB_DOCKER = '''#!/usr/bin/env python3
+import fcntl, json, os, sys
+dir = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(dir, 'docker-state.lock'), mode='w') as lock:
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    try:
+        with open(os.path.join(dir, 'docker-state.json')) as f:
+            containers = json.load(f)
+    except FileNotFoundError:
+        containers = {}
+    args = sys.argv[1:]
+    if args[0] == 'ps':
+        name_filter = args[args.index('--filter') + 1].split('=', 1)[1] if '--filter' in args else ''
+        for name, state in containers.items():
+            if name_filter in name:
+                print(json.dumps({'ID': name, 'Names': name, 'State': state, 'Status': 'Up 1 second' if state == 'running' else 'Exited (0)'}))
+    elif args[0] == 'run':
+        name = [arg.split('=', 1)[1] for arg in args if arg.startswith('--name=')][0]
+        if name in containers:
+            sys.exit(125)
+        containers[name] = 'running'
+        with open(os.path.join(dir, 'docker-runs.jsonl'), mode='a') as f:
+            f.write(json.dumps(args) + '\\n')
+        print(name)
+    elif args[0] == 'rm':
+        for name in args[1:]:
+            containers.pop(name, None)
+    elif args[0] in ['stop', 'kill']:
+        for name in args[1:]:
+            if name in containers:
+                containers[name] = 'exited'
+    with open(os.path.join(dir, 'docker-state.json'), mode='w') as f:
+        json.dump(containers, f)
+'''
+
+
+def make_scenario(num_clients: int, clients_per_org: int = 10) -> dict:
+    organizations = {}
+    num_orgs = max(1, (num_clients + clients_per_org - 1) // clients_per_org)
+    for i in range(num_orgs):
+        n = min(clients_per_org, num_clients - i * clients_per_org)
+        organizations[f'org{i + 1}'] = {
+            'override': {
+                'user': {
+                    'password': 'password',
+                    'organization': '{organization}'
+                },
+                'client': {
+                    'organization': '{organization}',
+                    'capacity': {
+                        'num_of_gpus': 0,
+                        'mem_per_gpu_in_GiB': 0
+                    }
+                }
+            },
+            'users': [
+                {
+                    'email': 'admin@{organization}.eu',
+                    'name': 'admin',
+                    'role': 'org_admin'
+                }
+            ],
+            'clients': [{'name': '{organization}-site-%d' % (j + 1)} for j in range(n)]
+        }
+    return {'organizations': organizations}
+
+
+def write_json(file: str, obj: dict):
+    with open(file, mode='w') as f:
+        json.dump(obj, f, indent=2)
+
+
+def prepare_workdir(workdir: str, url: str):
+    write_json(os.path.join(workdir, 'papi.json'), {
+        'host': url,
+        'oidc_account': 'mock',
+        'tool_name': 'ai4os-nvflare',
+        'vo': 'vo.ai4eosc.eu'
+    })
+    write_json(os.path.join(workdir, 'job.json'), {
+        'dashboard': {
+            'username': 'admin@nvflare.eu',
+            'password': 'password',
+            'project_short_name': 'bench',
+            'project_title': 'bench',
+            'project_description': 'benchmark',
+            'project_starting_date': '2024-10-07',
+            'project_end_date': '',
+            'project_public': True,
+            'project_frozen': True
+        },
+        'server': {
+            'jupyter_password': 'password'
+        }
+    })
+    # the tool asks oidc-agent for the PAPI access token; the mock accepts any token
+    bin_dir = os.path.join(workdir, 'bin')
+    os.makedirs(bin_dir, exist_ok=True)
+    oidc_token = os.path.join(bin_dir, 'oidc-token')
+    with open(oidc_token, mode='w') as f:
+        f.write('#!/bin/sh\necho %s\n' % make_jwt({'sub': 'bench', 'exp': time.time() + 3600}))
+    os.chmod(oidc_token, 0o755)
+    return bin_dir
+
+
+def run_tool(args: list, workdir: str, env: dict) -> dict:
+    cmd = [sys.executable, TOOL, '--cfg-papi', 'papi.json', '--cfg-job', 'job.json'] + args
+    logger.debug('running: %s' % shlex.join(cmd))
+    started = time.monotonic()
+    p = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    output = p.stdout.read()
+    # wait4 gives the resource usage of this child only
+    _, status, rusage = os.wait4(p.pid, 0)
+    p.returncode = os.waitstatus_to_exitcode(status)
+    wall_time = time.monotonic() - started
+    if p.returncode != 0:
+        logger.error(f'{shlex.join(args)} failed with exit code {p.returncode}:\n{output}')
+        raise Exception(f'tool failed with exit code {p.returncode}')
+    return {
+        'wall_time': wall_time,
+        'peak_rss_mib': rusage.ru_maxrss / 1024,
+        'output': output
+    }
+
+
+def install_stub_docker(bin_dir: str):
+    docker = os.path.join(bin_dir, 'docker')
+    with open(docker, mode='w') as f:
+        f.write(STUB_DOCKER)
+    os.chmod(docker, 0o755)
+
+
+def check_launches(bin_dir: str, job_dir: str, job_ID: str, clients: list):
+    # the docker run arguments built from the parsed docker.sh of each kit must carry what the mock's docker.sh declares
+    with open(os.path.join(bin_dir, 'docker-runs.jsonl'), mode='r') as f:
+        runs = {[arg for arg in args if arg.startswith('--name=')][0][len('--name='):]: args for args in map(json.loads, f)}
+    if len(runs) != len(clients):
+        raise Exception(f'{len(runs)} containers started for {len(clients)} clients')
+    for org, name in clients:
+        args = runs.get(f'{job_ID}_{name}')
+        if not args:
+            raise Exception(f'client {name} was not started')
+        mounts = [args[i + 1] for i, arg in enumerate(args[:-1]) if arg == '-v']
+        expected = {
+            'detached': '-d' in args,
+            'image': 'nvflare/nvflare' in args,
+            'workspace': f'{os.path.join(job_dir, org, name)}:/workspace/' in [os.path.normpath(m.split(':', 1)[0]) + ':' + m.split(':', 1)[1] for m in mounts],
+            'data': f'{os.path.join(job_dir, "data", org, name)}:/data/:ro' in mounts,
+            'command': args[-3:-1] == ['/bin/bash', '-c'] and f'--set uid={name} ' in args[-1]
+        }
+        wrong = [key for key, ok in expected.items() if not ok]
+        if wrong:
+            raise Exception(f'docker run of client {name} does not match its docker.sh ({", ".join(wrong)}): {shlex.join(args)}')
+
+
+def get_stats(server: MockServer) -> dict:
+    return server.state.stats()
+
+
+def bench_size(server: MockServer, num_clients: int, extra_args: list, keep: bool = False, start: bool = False) -> list:
+    workdir = tempfile.mkdtemp(prefix=f'bench-nvflare-{num_clients}-')
+    bin_dir = prepare_workdir(workdir, server.url)
+    write_json(os.path.join(workdir, 'scenario.json'), make_scenario(num_clients))
+    env = dict(os.environ)
+    env['PATH'] = bin_dir + os.pathsep + env.get('PATH', '')
+    env['NVFL_JOBS_DIR'] = os.path.join(workdir, 'jobs')
+    env.pop('NVFL_JOBID', None)
+    results = []
+
+    server.state.reset()
+    r = run_tool(['job', '--start', '--wait'], workdir, env)
+    # the job ID is the only bare UUID line in the output, logs are printed to stdout too
+    job_ID = [line.strip() for line in r['output'].splitlines() if re.fullmatch(r'[0-9a-f-]{36}', line.strip())][0]
+    results.append(dict(phase='job --start', clients=num_clients, requests=get_stats(server)['requests'], **{k: r[k] for k in ['wall_time', 'peak_rss_mib']}))
+
+    server.state.reset()
+    r = run_tool(['scenario', '--jobid', job_ID, '--init', '--download'] + extra_args, workdir, env)
+    stats = get_stats(server)
+    results.append(dict(phase='scenario --init --download', clients=num_clients, requests=stats['requests'], rejected=stats['rejected'], endpoints=stats['endpoints'], **{k: r[k] for k in ['wall_time', 'peak_rss_mib']}))
+
+    if start:
+        install_stub_docker(bin_dir)
+        server.state.reset()
+        r = run_tool(['scenario', '--jobid', job_ID, '--start'] + extra_args, workdir, env)
+        stats = get_stats(server)
+        scenario = make_scenario(num_clients)
+        clients = [(org, client['name'].format(organization=org)) for org, cfg in scenario['organizations'].items() for client in cfg['clients']]
+        check_launches(bin_dir, os.path.join(env['NVFL_JOBS_DIR'], job_ID), job_ID, clients)
+        results.append(dict(phase='scenario --start', clients=num_clients, requests=stats['requests'], rejected=stats['rejected'], endpoints=stats['endpoints'], **{k: r[k] for k in ['wall_time', 'peak_rss_mib']}))
+
+    if not keep:
+        subprocess.run(['rm', '-rf', workdir])
+    else:
+        logger.info(f'kept work directory {workdir}')
+    return results
+
+
+def print_results(results: list, file=sys.stdout):
+    rows = [('PHASE', 'CLIENTS', 'WALL TIME [s]', 'REQUESTS', 'REJECTED', 'PEAK RSS [MiB]')]
+    for r in results:
+        rows.append((r['phase'], str(r['clients']), '%.2f' % r['wall_time'], str(r['requests']), str(r.get('rejected', 0)), '%.1f' % r['peak_rss_mib']))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    line = '-' * (sum(widths) + 3 * len(widths) + 1)
+    print(line, file=file)
+    for i, row in enumerate(rows):
+        print('| ' + ' | '.join(value.ljust(widths[j]) for j, value in enumerate(row)) + ' |', file=file)
+        if i == 0:
+            print(line, file=file)
+    print(line, file=file, flush=True)
+
+
+def main(args):
+    logger.setLevel(args.log_level)
+    server = MockServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        kit_size=args.kit_size,
+        capacity=args.capacity
+    ).start()
+    logger.info(f'mock PAPI and NVFLARE Dashboard listening on {server.url}')
+    results = []
+    try:
+        for num_clients in [int(n) for n in args.sizes.split(',')]:
+            logger.info(f'benchmarking a federation of {num_clients} clients')
+            results += bench_size(server, num_clients, shlex.split(args.scenario_args), keep=args.keep, start=args.start)
+    finally:
+        server.stop()
+    print_results(results)
+    if args.json:
+        write_json(args.json, {'results': results})
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+
+    parser.add_argument('--log-level', action='store', type=str, default='INFO')
+    parser.add_argument('--sizes', action='store', type=str, default='10,100,1000', help='comma separated numbers of clients')
+    parser.add_argument('--scenario-args', action='store', type=str, default='', help='extra arguments of the scenario subcommand, e.g. "--parallel 8 --pipeline"')
+    parser.add_argument('--latency', action='store', type=float, default=0, help='added latency of each API call in seconds')
+    parser.add_argument('--jitter', action='store', type=float, default=0, help='max. random latency added on top of --latency in seconds')
+    parser.add_argument('--error-rate', action='store', type=float, default=0, help='fraction of API calls answered with 503')
+    parser.add_argument('--capacity', action='store', type=int, default=0, help='max. number of API calls the mock handles at once, more are answered with 429')
+    parser.add_argument('--kit-size', action='store', type=int, default=0, help='bytes of padding added to each startup kit')
+    parser.add_argument('--json', action='store', type=str, default=None, help='write the results to this JSON file')
+    parser.add_argument('--keep', action='store_true', help='keep the work directories')
+    parser.add_argument('--start', action='store_true', help='also start the clients, with a stub docker command that only records the containers, and check their docker run arguments against docker.sh')
+
+    args = parser.parse_args()
+    main(args)
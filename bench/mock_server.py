@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+import re
+import sys
+import logging
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+logging.basicConfig(
+    format='%(asctime)s | %(name)s | %(levelname)s : %(message)s',
+    level=logging.INFO,
+    stream=sys.stdout
+)
+logger = logging.getLogger('mock-nvflare')
+
+import argparse
+import base64
+import io
+import json
+import random
+import stat
+import time
+import uuid
+import zipfile
+
+
+def make_jwt(claims: dict) -> str:
+    def b64(d: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(d).encode()).decode().rstrip('=')
+    return '%s.%s.%s' % (b64({'alg': 'none', 'typ': 'JWT'}), b64(claims), 'mock')
+
+
+DOCKER_SH = '''#!/usr/bin/env bash
+DIR="$( cd "$( dirname "${{BASH_SOURCE[0]}}" )" >/dev/null 2>&1 && pwd )"
+: ${{MY_DATA_DIR:="/home/flclient/data"}}
+NETARG="--net=host"
+DOCKER_IMAGE=nvflare/nvflare
+echo "Starting docker with $DOCKER_IMAGE"
+mode="${{1:--r}}"
+if [ $mode = "-d" ]
+then
+  docker run -d --rm --name={name} $GPU2USE -u $(id -u):$(id -g) \\
+  -v /etc/passwd:/etc/passwd -v /etc/group:/etc/group -v $DIR/..:/workspace/ \\
+  -v $MY_DATA_DIR:/data/:ro -w /workspace/ --ipc=host $NETARG $DOCKER_IMAGE \\
+  /bin/bash -c "python -u -m nvflare.private.fed.app.client.client_train -m /workspace -s fed_client.json --set uid={name} secure_train=true config_folder=config org_name={org}"
+else
+  docker run --rm -it --name={name} $GPU2USE -u $(id -u):$(id -g) \\
+  -v /etc/passwd:/etc/passwd -v /etc/group:/etc/group -v $DIR/..:/workspace/ \\
+  -v $MY_DATA_DIR:/data/:ro -w /workspace/ --ipc=host $NETARG $DOCKER_IMAGE /bin/bash
+fi
+'''
+
+
+def make_kit(root: str, files: dict, kit_size: int = 0) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for path, (content, mode) in files.items():
+            info = zipfile.ZipInfo(f'{root}/{path}')
+            info.create_system = 3
+            info.external_attr = (stat.S_IFREG | mode) << 16
+            zf.writestr(info, content)
+        if kit_size > 0:
+            # incompressible padding, to simulate large kits
+            info = zipfile.ZipInfo(f'{root}/local/padding.bin')
+            info.create_system = 3
+            info.external_attr = (stat.S_IFREG | 0o644) << 16
+            zf.writestr(info, random.randbytes(kit_size), compress_type=zipfile.ZIP_STORED)
+    return buf.getvalue()
+
+
+class MockDashboard:
+
+    def __init__(self, username: str, password: str, token_ttl: float = 900):
+        self.token_ttl = token_ttl
+        self.lock = threading.Lock()
+        self.users = {}
+        self.clients = {}
+        self.passwords = {}
+        self.tokens = {}
+        self.next_id = 1
+        self.add_user(username, password, name='admin', organization='', role='project_admin', approval_state=100)
+
+    def add_user(self, email, password, name, organization, role, approval_state=0):
+        user = {
+            'id': self.next_id,
+            'email': email,
+            'name': name,
+            'organization': organization,
+            'role': role,
+            'approval_state': approval_state,
+            'description': ''
+        }
+        self.next_id += 1
+        self.users[user['id']] = user
+        self.passwords[email] = password
+        return user
+
+    def login(self, email, password):
+        if self.passwords.get(email) != password:
+            return None
+        token = make_jwt({'sub': email, 'exp': time.time() + self.token_ttl, 'jti': str(uuid.uuid4())})
+        self.tokens[token] = email
+        return token
+
+    def get_user_by_email(self, email):
+        for user in self.users.values():
+            if user['email'] == email:
+                return user
+        return None
+
+
+class MockState:
+
+    def __init__(self, latency: float = 0, jitter: float = 0, error_rate: float = 0, ready_after: float = 0, kit_size: int = 0, token_ttl: float = 900,
+                 capacity: int = 0, retry_after: float = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # max. number of API calls handled at once, more are answered with 429; 0 is unlimited
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.rejected = 0
+        self.ready_after = ready_after
+        self.kit_size = kit_size
+        self.token_ttl = token_ttl
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.counts = {}
+        self.errors = 0
+
+    def count(self, endpoint: str):
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'requests': sum(self.counts.values()), 'errors': self.errors, 'rejected': self.rejected, 'endpoints': dict(self.counts)}
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+            self.errors = 0
+            self.rejected = 0
+
+
+class MockHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'mock-nvflare'
+    # headers and body are written separately; without this, delayed ACKs add ~40 ms to every keep-alive request
+    disable_nagle_algorithm = True
+
+    # (method, pattern, handler name, endpoint label)
+    routes = [
+        ('POST', r'^/v1/deployments/tools/?$', 'papi_deploy', 'papi:deploy'),
+        ('GET', r'^/v1/deployments/tools/(?P<job>[^/]+)$', 'papi_get', 'papi:get'),
+        ('DELETE', r'^/v1/deployments/tools/(?P<job>[^/]+)$', 'papi_delete', 'papi:delete'),
+        ('GET', r'^/jobs/(?P<job>[^/]+)/jupyter/?$', 'jupyter', 'jupyter'),
+        ('GET', r'^/jobs/(?P<job>[^/]+)/[^/]+/?$', 'dashboard_root', 'dashboard:root'),
+        ('GET', r'^/jobs/(?P<job>[^/]+)/[^/]+/api/v1/project$', 'get_project', 'dashboard:get_project'),
+        ('POST', r'^/jobs/(?P<job>[^/]+)/[^/]+/api/v1/login$', 'login', 'dashboard:login'),
+        ('GET', r'^/jobs/(?P<job>[^/]+)/[^/]+/api/v1/users$', 'get_users', 'dashboard:get_users'),
+        ('POST', r'^/jobs/(?P<job>[^/]+)/[^/]+/api/v1/users$', 'create_user', 'dashboard:create_user'),
+        ('PATCH', r'^/jobs/(?P<job>[^/]+)/[^/]+/api/v1/users/(?P<id>\d+)$', 'update_user', 'dashboard:update_user'),
+        ('POST', r'^/jobs/(?P<job>[^/]+)/[^/]+/api/v1/users/(?P<id>\d+)/blob$', 'user_blob', 'dashboard:user_blob'),
+        ('GET', r'^/jobs/(?P<job>[^/]+)/[^/]+/api/v1/clients$', 'get_clients', 'dashboard:get_clients'),
+        ('POST', r'^/jobs/(?P<job>[^/]+)/[^/]+/api/v1/clients$', 'create_client', 'dashboard:create_client'),
+        ('PATCH', r'^/jobs/(?P<job>[^/]+)/[^/]+/api/v1/clients/(?P<id>\d+)$', 'update_client', 'dashboard:update_client'),
+        ('POST', r'^/jobs/(?P<job>[^/]+)/[^/]+/api/v1/clients/(?P<id>\d+)/blob$', 'client_blob', 'dashboard:client_blob'),
+        ('GET', r'^/_mock/stats$', 'mock_stats', None),
+        ('POST', r'^/_mock/reset$', 'mock_reset', None),
+    ]
+
+    @property
+    def state(self) -> MockState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_json(self, code: int, obj, headers: dict = {}):
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_blob(self, filename: str, body: bytes):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return {}
+
+    def dispatch(self, method: str):
+        path = urlparse(self.path).path
+        for route_method, pattern, handler, label in self.routes:
+            m = re.match(pattern, path)
+            if route_method != method or not m:
+                continue
+            if not label:
+                return getattr(self, handler)(**m.groupdict())
+            self.state.count(label)
+            with self.state.lock:
+                overloaded = self.state.capacity and self.state.in_flight >= self.state.capacity
+                if overloaded:
+                    self.state.rejected += 1
+                else:
+                    self.state.in_flight += 1
+            if overloaded:
+                self.read_json()
+                return self.send_json(429, {'status': 'error', 'message': 'too many requests'}, {'Retry-After': '%g' % self.state.retry_after})
+            try:
+                delay = self.state.latency + random.uniform(0, self.state.jitter)
+                if delay > 0:
+                    time.sleep(delay)
+                if random.random() < self.state.error_rate:
+                    with self.state.lock:
+                        self.state.errors += 1
+                    self.read_json()
+                    return self.send_json(503, {'status': 'error', 'message': 'injected error'}, {'Retry-After': '0'})
+                return getattr(self, handler)(**m.groupdict())
+            finally:
+                with self.state.lock:
+                    self.state.in_flight -= 1
+        self.read_json()
+        self.send_json(404, {'status': 'error', 'message': f'no route for {method} {path}'})
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PATCH(self):
+        self.dispatch('PATCH')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def job(self, job: str) -> dict | None:
+        return self.state.jobs.get(job)
+
+    def dashboard(self, job: str) -> MockDashboard | None:
+        j = self.job(job)
+        return j['dashboard'] if j else None
+
+    def is_ready(self, job: str) -> bool:
+        j = self.job(job)
+        return bool(j) and time.time() - j['created'] >= self.state.ready_after
+
+    def requester(self, dashboard: MockDashboard) -> dict | None:
+        auth = self.headers.get('Authorization', '')
+        if not auth.startswith('Bearer '):
+            return None
+        email = dashboard.tokens.get(auth[len('Bearer '):])
+        return dashboard.get_user_by_email(email) if email else None
+
+    # PAPI
+
+    def papi_deploy(self):
+        data = self.read_json()
+        nvflare = data.get('nvflare', {})
+        job_ID = str(uuid.uuid1())
+        self.state.jobs[job_ID] = {
+            'created': time.time(),
+            'dashboard': MockDashboard(nvflare.get('username', 'admin'), nvflare.get('password', ''), token_ttl=self.state.token_ttl)
+        }
+        logger.info(f'deployed job {job_ID}')
+        self.send_json(200, {'status': 'success', 'job_ID': job_ID})
+
+    def papi_get(self, job):
+        if not self.job(job):
+            return self.send_json(404, {'detail': f'job {job} not found'})
+        base = f'{self.base_url()}/jobs/{job}'
+        self.send_json(200, {'job_ID': job, 'status': 'running', 'endpoints': {'dashboard': f'{base}/', 'server-jupyter': f'{base}/jupyter/'}})
+
+    def papi_delete(self, job):
+        if not self.state.jobs.pop(job, None):
+            return self.send_json(404, {'detail': f'job {job} not found'})
+        self.send_json(200, {'status': 'success'})
+
+    def jupyter(self, job):
+        self.send_json(200 if self.is_ready(job) else 502, {})
+
+    def dashboard_root(self, job):
+        self.send_json(200 if self.is_ready(job) else 502, {})
+
+    # NVFLARE Dashboard
+
+    def get_project(self, job):
+        # the project is public; it is frozen once the Dashboard is ready, as after provisioning
+        if not self.job(job):
+            return self.send_json(404, {'status': 'error'})
+        self.send_json(200, {'status': 'ok', 'project': {'frozen': self.is_ready(job)}})
+
+    def login(self, job):
+        req = self.read_json()
+        dashboard = self.dashboard(job)
+        if not dashboard:
+            return self.send_json(404, {'status': 'error'})
+        with dashboard.lock:
+            token = dashboard.login(req.get('email'), req.get('password'))
+            user = dashboard.get_user_by_email(req.get('email'))
+        if not token:
+            return self.send_json(401, {'status': 'unauthenticated'})
+        self.send_json(200, {'status': 'ok', 'user': user, 'access_token': token})
+
+    def create_user(self, job):
+        req = self.read_json()
+        dashboard = self.dashboard(job)
+        with dashboard.lock:
+            if dashboard.get_user_by_email(req.get('email')):
+                return self.send_json(409, {'status': 'conflicting', 'message': 'user already exists'})
+            user = dashboard.add_user(req['email'], req['password'], req.get('name', ''), req.get('organization', ''), req.get('role', 'lead'))
+        self.send_json(201, {'status': 'ok', 'user': user})
+
+    def get_users(self, job):
+        dashboard = self.dashboard(job)
+        requester = self.requester(dashboard)
+        if not requester:
+            return self.send_json(401, {'status': 'unauthorized'})
+        with dashboard.lock:
+            users = [u for u in dashboard.users.values() if requester['role'] == 'project_admin' or u['organization'] == requester['organization']]
+        self.send_json(200, {'status': 'ok', 'user_list': users})
+
+    def update_user(self, job, id):
+        req = self.read_json()
+        dashboard = self.dashboard(job)
+        requester = self.requester(dashboard)
+        if not requester or requester['role'] != 'project_admin':
+            return self.send_json(401, {'status': 'unauthorized'})
+        with dashboard.lock:
+            user = dashboard.users.get(int(id))
+            if not user:
+                return self.send_json(404, {'status': 'error'})
+            user.update({k: v for k, v in req.items() if k in ['approval_state', 'name', 'description', 'role']})
+        self.send_json(200, {'status': 'ok', 'user': user})
+
+    def user_blob(self, job, id):
+        self.read_json()
+        dashboard = self.dashboard(job)
+        requester = self.requester(dashboard)
+        if not requester or requester['id'] != int(id):
+            return self.send_json(401, {'status': 'unauthorized'})
+        kit = make_kit('admin', {
+            'startup/fl_admin.sh': ('#!/usr/bin/env bash\necho mock admin console\n', 0o755),
+            'startup/fed_admin.json': (json.dumps({'admin': {'username': requester['email']}}), 0o644),
+            'transfer/.keep': ('', 0o644)
+        }, self.state.kit_size)
+        self.send_blob(f'{requester["email"]}.zip', kit)
+
+    def get_clients(self, job):
+        dashboard = self.dashboard(job)
+        requester = self.requester(dashboard)
+        if not requester:
+            return self.send_json(401, {'status': 'unauthorized'})
+        with dashboard.lock:
+            clients = [c for c in dashboard.clients.values() if requester['role'] == 'project_admin' or c['organization'] == requester['organization']]
+        self.send_json(200, {'status': 'ok', 'client_list': clients})
+
+    def create_client(self, job):
+        req = self.read_json()
+        dashboard = self.dashboard(job)
+        requester = self.requester(dashboard)
+        if not requester:
+            return self.send_json(401, {'status': 'unauthorized'})
+        with dashboard.lock:
+            if any(c['name'] == req.get('name') for c in dashboard.clients.values()):
+                return self.send_json(409, {'status': 'conflicting', 'message': 'client already exists'})
+            client = {
+                'id': dashboard.next_id,
+                'name': req['name'],
+                'organization': req.get('organization', requester['organization']),
+                'capacity': req.get('capacity', {}),
+                'creator_id': requester['id'],
+                'approval_state': 0,
+                'description': ''
+            }
+            dashboard.next_id += 1
+            dashboard.clients[client['id']] = client
+        self.send_json(201, {'status': 'ok', 'client': client})
+
+    def update_client(self, job, id):
+        req = self.read_json()
+        dashboard = self.dashboard(job)
+        requester = self.requester(dashboard)
+        if not requester or requester['role'] != 'project_admin':
+            return self.send_json(401, {'status': 'unauthorized'})
+        with dashboard.lock:
+            client = dashboard.clients.get(int(id))
+            if not client:
+                return self.send_json(404, {'status': 'error'})
+            client.update({k: v for k, v in req.items() if k in ['approval_state', 'capacity', 'description']})
+        self.send_json(200, {'status': 'ok', 'client': client})
+
+    def client_blob(self, job, id):
+        self.read_json()
+        dashboard = self.dashboard(job)
+        requester = self.requester(dashboard)
+        with dashboard.lock:
+            client = dashboard.clients.get(int(id))
+        if not requester or not client or (requester['role'] != 'project_admin' and requester['organization'] != client['organization']):
+            return self.send_json(401, {'status': 'unauthorized'})
+        if client['approval_state'] != 100:
+            return self.send_json(401, {'status': 'unauthorized', 'message': 'client not approved'})
+        kit = make_kit(client['name'], {
+            'startup/docker.sh': (DOCKER_SH.format(name=client['name'], org=client['organization']), 0o755),
+            'startup/start.sh': ('#!/usr/bin/env bash\necho mock client\n', 0o755),
+            'startup/fed_client.json': (json.dumps({'client': {'name': client['name']}}), 0o644),
+            'startup/client.key': ('mock key\n', 0o600)
+        }, self.state.kit_size)
+        self.send_blob(f'{client["name"]}.zip', kit)
+
+    def mock_stats(self):
+        self.send_json(200, self.state.stats())
+
+    def mock_reset(self):
+        self.read_json()
+        self.state.reset()
+        self.send_json(200, {'status': 'ok'})
+
+
+class MockServer:
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, **kwargs):
+        self.state = MockState(**kwargs)
+        self.httpd = ThreadingHTTPServer((host, port), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = self.state
+        self.__thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.httpd.serve_forever, name='mock-server', daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main(args):
+    logger.setLevel(args.log_level)
+    server = MockServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        ready_after=args.ready_after,
+        kit_size=args.kit_size,
+        token_ttl=args.token_ttl,
+        capacity=args.capacity,
+        retry_after=args.retry_after
+    )
+    logger.info(f'mock PAPI and NVFLARE Dashboard listening on {server.url}')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+
+    parser.add_argument('--log-level', action='store', type=str, default='INFO')
+    parser.add_argument('--host', action='store', type=str, default='127.0.0.1')
+    parser.add_argument('--port', action='store', type=int, default=8000)
+    parser.add_argument('--latency', action='store', type=float, default=0, help='added latency of each API call in seconds')
+    parser.add_argument('--jitter', action='store', type=float, default=0, help='max. random latency added on top of --latency in seconds')
+    parser.add_argument('--error-rate', action='store', type=float, default=0, help='fraction of API calls answered with 503')
+    parser.add_argument('--ready-after', action='store', type=float, default=0, help='seconds after deployment until the Dashboard and JupyterLab respond with 200')
+    parser.add_argument('--kit-size', action='store', type=int, default=0, help='bytes of padding added to each startup kit')
+    parser.add_argument('--token-ttl', action='store', type=float, default=900, help='lifetime of Dashboard access tokens in seconds')
+    parser.add_argument('--capacity', action='store', type=int, default=0, help='max. number of API calls handled at once, more are answered with 429; 0 is unlimited')
+    parser.add_argument('--retry-after', action='store', type=float, default=1, help='Retry-After of the 429 responses in seconds')
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,168 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tool_nvflare as tool
+from mock_server import MockServer, make_kit
+
+
+@pytest.fixture
+def overloaded_server():
+    srv = MockServer(capacity=1, latency=0.05, retry_after=0.3).start()
+    yield srv
+    srv.stop()
+
+
+def test_limiter_blocks_for_retry_after():
+    limiter = tool.ConcurrencyLimiter(initial=4)
+    limiter.on_overload(time.monotonic(), retry_after=0.2)
+    assert int(limiter.limit) == 2
+    start = time.monotonic()
+    with limiter.slot():
+        pass
+    assert time.monotonic() - start >= 0.19
+    assert limiter.stats == {'peak_in_flight': 1, 'overloads': 1, 'throttled': 1}
+
+
+def test_limiter_cuts_once_per_congestion():
+    limiter = tool.ConcurrencyLimiter(initial=8)
+    started = time.monotonic()
+    limiter.on_overload(started)
+    # requests sent before the decrease report the same congestion
+    limiter.on_overload(started)
+    assert int(limiter.limit) == 4
+    assert limiter.stats['overloads'] == 2
+
+
+def test_session_backs_off_on_429(overloaded_server):
+    session = tool.HTTPSession(initial_concurrency=8, retries=5, backoff_factor=0.05)
+    url = f'{overloaded_server.url}/v1/deployments/tools/unknown'
+    statuses = []
+
+    def get():
+        resp = session.get(url)
+        statuses.append(resp.status_code)
+        resp.close()
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    limiter = session.get_limiter(url)
+    assert overloaded_server.state.rejected > 0
+    assert limiter.stats['overloads'] > 0
+    assert limiter.limit < 8
+    # the Retry-After of the first 429 held back every request to the host
+    assert time.monotonic() - start >= overloaded_server.state.retry_after
+    assert 429 not in statuses
+
+
+def test_batcher_dedupes_concurrent_ids():
+    batches = []
+    lock = threading.Lock()
+
+    def approve_many(objs):
+        with lock:
+            batches.append([obj['id'] for obj in objs])
+        time.sleep(0.02)
+        # 'missing' is left out of the result, 'boom' fails the whole batch
+        if any(obj['id'] == 'boom' for obj in objs):
+            raise RuntimeError('boom')
+        return {'approved': [obj for obj in objs if obj['id'] != 'missing']}
+
+    batcher = tool.ApprovalBatcher(approve_many)
+    results = {}
+
+    def approve(n):
+        objs = [{'id': f'c{n % 5}'}, {'id': f'c{n % 5}'}, {'id': 'shared'}]
+        if n == 7:
+            objs.append({'id': 'missing'})
+        results[n] = batcher.approve(objs)
+
+    threads = [threading.Thread(target=approve, args=(n,)) for n in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    assert not any(t.is_alive() for t in threads)
+
+    for batch in batches:
+        assert len(batch) == len(set(batch))
+    for n, result in results.items():
+        # one entry per requested object, duplicates included
+        assert [obj['id'] for obj in result['approved']] == [f'c{n % 5}', f'c{n % 5}', 'shared']
+        if n == 7:
+            assert [obj['id'] for obj in result['failed']] == ['missing']
+            assert result['failed'][0]['error'] == 'no approval outcome'
+        else:
+            assert result['failed'] == []
+
+    result = batcher.approve([{'id': 'boom'}, {'id': 'c1'}])
+    assert [obj['id'] for obj in result['failed']] == ['boom', 'c1']
+    assert "RuntimeError('boom')" in result['failed'][0]['error']
+
+
+def test_download_cache_round_trip(tmp_path):
+    download_dir = str(tmp_path / 'downloads')
+    extract_dir = str(tmp_path / 'kits')
+    downloads = []
+
+    def download(content: bytes):
+        def run():
+            downloads.append(content)
+            file = os.path.join(download_dir, 'site-1.zip')
+            with open(file, mode='wb') as f:
+                f.write(content)
+            return file
+        return run
+
+    kit_v1 = make_kit('site-1', {'startup/start.sh': (b'echo v1\n', 0o755), 'local/cfg.json': (b'{}', 0o644)})
+    kit_v2 = make_kit('site-1', {'startup/start.sh': (b'echo v2\n', 0o755), 'local/cfg.json': (b'{}', 0o644)})
+    record = {'id': 1, 'name': 'site-1', 'organization': 'org1', 'approval_state': 100, 'download_count': 0}
+
+    os.makedirs(download_dir)
+    cache = tool.DownloadCache(download_dir)
+    file = cache.fetch('client:site-1', record, download(kit_v1))
+    assert os.path.isfile(file)
+    # counters are not part of the record hash
+    assert cache.fetch('client:site-1', dict(record, download_count=1), download(kit_v1)) == file
+    os.remove(file)
+    assert cache.fetch('client:site-1', record, download(kit_v1)) == file
+    assert os.path.isfile(file)
+    assert len(downloads) == 1
+
+    assert cache.extract('client:site-1', file, extract_dir, pin='1234')
+    assert not cache.extract('client:site-1', file, extract_dir, pin='1234')
+    start_sh = os.path.join(extract_dir, 'site-1', 'startup', 'start.sh')
+    # an edit keeping the size is told apart by the CRC32
+    with open(start_sh, mode='w') as f:
+        f.write('echo v0\n')
+    assert cache.extract('client:site-1', file, extract_dir, pin='1234')
+    with open(start_sh) as f:
+        assert f.read() == 'echo v1\n'
+    assert os.stat(start_sh).st_mode & 0o777 == 0o755
+    assert cache.extracted_dirs() == [os.path.join(extract_dir, 'site-1')]
+    cache.save()
+
+    # the manifest is kept across runs; a changed record fetches the kit again and prunes the old object
+    cache = tool.DownloadCache(download_dir)
+    assert cache.fetch('client:site-1', record, download(kit_v1)) == file
+    old_object = cache.object_file(cache.file_hash(file))
+    cache.fetch('client:site-1', dict(record, approval_state=0), download(kit_v2))
+    assert len(downloads) == 2
+    assert not os.path.exists(old_object)
+    assert os.listdir(cache.objects_dir) == [f'{cache.file_hash(file)}.zip']
+    assert cache.extract('client:site-1', file, extract_dir, pin='1234')
+    with open(start_sh) as f:
+        assert f.read() == 'echo v2\n'
+
+    cache.fetch('client:site-1', dict(record, approval_state=0), download(kit_v2), force=True)
+    assert len(downloads) == 3
+    assert cache.stats == {'downloaded': 2, 'cached': 1, 'extracted': 1, 'up_to_date': 0}
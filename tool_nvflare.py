@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
 import re
+import shlex
+import signal
+import socket
+import socketserver
 import sys
 import logging
 import tempfile
+import zipfile
+import zlib
 
-from urllib.parse import urljoin
+from contextlib import ExitStack, contextmanager, redirect_stderr, redirect_stdout
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin, urlparse
 from requests import Response
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logging.basicConfig(
     format='%(asctime)s | %(name)s | %(levelname)s : %(message)s',
@@ -15,13 +25,26 @@ logging.basicConfig(
 logger = logging.getLogger('tool-nvflare')
 
 import argparse
+import base64
+import cProfile
 import cgi
+import hashlib
 import json
+import math
 import os
+import pstats
+import random
 import requests
+import shutil
 import subprocess
+import threading
 import time
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Callable
+
 
 def load_config(file: str) -> dict:
     logger.debug(f'loading configuration: {file}')
@@ -29,42 +52,625 @@ def load_config(file: str) -> dict:
         return json.load(f)
 
 
+class Template:
+
+    def __init__(self, placeholders: tuple):
+        self.placeholders = tuple(placeholders)
+        # a single alternation over all placeholders (longest first), so each string is scanned once
+        self.__pattern = re.compile('|'.join(re.escape(p) for p in sorted(self.placeholders, key=len, reverse=True))) \
+            if self.placeholders else None
+
+    def expand_str(self, x: str, vars: dict) -> str:
+        if self.__pattern is None or '{' not in x:
+            return x
+        # placeholders without a value are left as they are
+        return self.__pattern.sub(lambda m: str(vars.get(m.group(0), m.group(0))), x)
+
+    def expand(self, x, vars: dict = {}):
+        # returns a new structure, the input is never modified
+        if isinstance(x, str):
+            return self.expand_str(x, vars)
+        if isinstance(x, dict):
+            return {k: self.expand(v, vars) for k, v in x.items()}
+        if isinstance(x, list):
+            return [self.expand(v, vars) for v in x]
+        return x
+
+
+@lru_cache(maxsize=64)
+def get_template(placeholders: tuple) -> Template:
+    return Template(placeholders)
+
+
 def expand_vars(x: list | dict, vars: dict = {}):
-    if isinstance(x, dict):
-        for k, v in x.items():
-            if isinstance(v, list | dict):
-                x[k] = expand_vars(v, vars)
-            if isinstance(v, str):
-                for var, replacement in vars.items():
-                    x[k] = v.replace(var, replacement)
-    elif isinstance(x, list):
-        for i in range(len(x)):
-            x[i] = expand_vars(x[i], vars)
-    return x
+    return get_template(tuple(sorted(vars))).expand(x, vars)
 
 def expand_vars_and_override(x: list | dict, d_override: dict = {}, vars: dict = {}):
-    x = expand_vars(x, vars)
-    d_override = expand_vars(d_override, vars)
+    # in lists, `{index}` is the 1-based position of the item
+    template = get_template(tuple(sorted(set(vars) | {'{index}'})))
     if isinstance(x, list):
-        for i in range(len(x)):
-            x[i].update(d_override)
-    elif isinstance(x, dict):
-        x.update(d_override)
+        expanded = []
+        for i, item in enumerate(x):
+            item_vars = dict(vars)
+            item_vars['{index}'] = i + 1
+            item = template.expand(item, item_vars)
+            item.update(template.expand(d_override, item_vars))
+            expanded.append(item)
+        return expanded
+    x = template.expand(x, vars)
+    x.update(template.expand(d_override, vars))
     return x
 
 
-def wait_for_url(url: str, status_code: int = 200, num_retries: int = -1):
-    attempt = 0
-    while requests.get(url).status_code != status_code:
-        attempt+=1
-        if -1 < num_retries < attempt:
-            raise Exception(f'url check for response code {status_code} failed after {attempt}/{num_retries} attempts')
-        if attempt == 1:
-            logger.info('waiting for NVFLARE Dashboard to be ready')
-        print('.', end='', sep='', file=sys.stdout, flush=True)
-        time.sleep(1)
-    if attempt > 0:
-        print()
+class Metrics:
+
+    HTTP_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+    def __init__(self):
+        self.started = time.time()
+        self.__spans = {}
+        self.__http = {}
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe_span(name, time.monotonic() - started)
+
+    def observe_span(self, name: str, duration: float):
+        with self.__lock:
+            span = self.__spans.setdefault(name, {'count': 0, 'sum': 0.0, 'max': 0.0})
+            span['count'] += 1
+            span['sum'] += duration
+            span['max'] = max(span['max'], duration)
+
+    @staticmethod
+    def http_endpoint(url: str) -> str:
+        # ids and uuids in the path would give every object its own series
+        path = urlparse(url).path.rstrip('/') or '/'
+        return re.sub(r'/([0-9]+|[0-9a-fA-F]{8}-[0-9a-fA-F-]{27})(?=/|$)', '/{id}', path)
+
+    def observe_http(self, method: str, url: str, status: int | str, duration: float):
+        key = (method, urlparse(url).netloc, self.http_endpoint(url))
+        with self.__lock:
+            http = self.__http.setdefault(key, {'status': {}, 'sum': 0.0, 'count': 0, 'buckets': [0] * len(self.HTTP_BUCKETS)})
+            http['status'][str(status)] = http['status'].get(str(status), 0) + 1
+            http['sum'] += duration
+            http['count'] += 1
+            for i, le in enumerate(self.HTTP_BUCKETS):
+                if duration <= le:
+                    http['buckets'][i] += 1
+
+    def report(self) -> dict:
+        with self.__lock:
+            return {
+                'started': self.started,
+                'duration': time.time() - self.started,
+                'spans': {name: dict(span) for name, span in self.__spans.items()},
+                'http': [
+                    {
+                        'method': method,
+                        'host': host,
+                        'endpoint': endpoint,
+                        'count': http['count'],
+                        'sum': http['sum'],
+                        'status': dict(http['status']),
+                        'buckets': dict(zip([str(le) for le in self.HTTP_BUCKETS], http['buckets']))
+                    }
+                    for (method, host, endpoint), http in sorted(self.__http.items())
+                ]
+            }
+
+    def write_json(self, file: str, run_info: dict = {}):
+        report = self.report()
+        report.update(run_info)
+        write_file_atomic(file, json.dumps(report, indent=2))
+
+    def write_prometheus(self, file: str, run_info: dict = {}):
+        def labels(**kv):
+            return ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in kv.items())
+        report = self.report()
+        subcommand = run_info.get('subcommand', '')
+        lines = [
+            '# HELP nvfl_tool_run_duration_seconds Duration of the tool run.',
+            '# TYPE nvfl_tool_run_duration_seconds gauge',
+            'nvfl_tool_run_duration_seconds{%s} %f' % (labels(subcommand=subcommand), report['duration']),
+            '# HELP nvfl_tool_span_seconds Time spent in the phases and operations of the tool.',
+            '# TYPE nvfl_tool_span_seconds summary'
+        ]
+        for name, span in sorted(report['spans'].items()):
+            lines.append('nvfl_tool_span_seconds_sum{%s} %f' % (labels(span=name), span['sum']))
+            lines.append('nvfl_tool_span_seconds_count{%s} %d' % (labels(span=name), span['count']))
+        lines += [
+            '# HELP nvfl_tool_span_max_seconds Longest single duration of a phase or operation.',
+            '# TYPE nvfl_tool_span_max_seconds gauge'
+        ]
+        for name, span in sorted(report['spans'].items()):
+            lines.append('nvfl_tool_span_max_seconds{%s} %f' % (labels(span=name), span['max']))
+        lines += [
+            '# HELP nvfl_tool_http_requests_total HTTP requests by endpoint and status code.',
+            '# TYPE nvfl_tool_http_requests_total counter'
+        ]
+        for http in report['http']:
+            for status, count in sorted(http['status'].items()):
+                lines.append('nvfl_tool_http_requests_total{%s} %d' % (labels(method=http['method'], host=http['host'], endpoint=http['endpoint'], status=status), count))
+        lines += [
+            '# HELP nvfl_tool_http_request_duration_seconds HTTP request latency by endpoint.',
+            '# TYPE nvfl_tool_http_request_duration_seconds histogram'
+        ]
+        for http in report['http']:
+            kv = dict(method=http['method'], host=http['host'], endpoint=http['endpoint'])
+            for le, count in http['buckets'].items():
+                lines.append('nvfl_tool_http_request_duration_seconds_bucket{%s} %d' % (labels(**kv, le=le), count))
+            lines.append('nvfl_tool_http_request_duration_seconds_bucket{%s} %d' % (labels(**kv, le='+Inf'), http['count']))
+            lines.append('nvfl_tool_http_request_duration_seconds_sum{%s} %f' % (labels(**kv), http['sum']))
+            lines.append('nvfl_tool_http_request_duration_seconds_count{%s} %d' % (labels(**kv), http['count']))
+        write_file_atomic(file, '\n'.join(lines) + '\n')
+
+
+_metrics = Metrics()
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+def reset_metrics() -> Metrics:
+    global _metrics
+    _metrics = Metrics()
+    return _metrics
+
+
+def write_file_atomic(file: str, content: str, mode: int = 0o644):
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file)), prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode='w') as f:
+            f.write(content)
+        os.chmod(tmp_file, mode)
+        os.replace(tmp_file, file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+class ConcurrencyLimiter:
+
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 32, decrease: float = 0.5, retry_after_max: float = 60):
+        # AIMD: the limit grows by one per request while no overload was seen (slow start), then by
+        # one per window of successful requests; an overload signal cuts it by `decrease`. Close to the
+        # limit of the last overload the growth is `probe_slowdown` times slower, as every overload
+        # usually costs a Retry-After pause
+        self.limit = float(max(min(initial, max_limit), min_limit))
+        self.ceiling = float(max_limit)
+        self.probe_slowdown = 10
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.retry_after_max = retry_after_max
+        self.in_flight = 0
+        self.slow_start = True
+        self.stats = {'peak_in_flight': 0, 'overloads': 0, 'throttled': 0}
+        self.__last_decrease = 0.0
+        self.__blocked_until = 0.0
+        self.__cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        with self.__cond:
+            waited = False
+            while True:
+                delay = self.__blocked_until - time.monotonic()
+                if delay <= 0 and self.in_flight < int(self.limit):
+                    break
+                waited = True
+                self.__cond.wait(timeout=delay if delay > 0 else None)
+            if waited:
+                self.stats['throttled'] += 1
+            self.in_flight += 1
+            self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.in_flight)
+        try:
+            yield
+        finally:
+            with self.__cond:
+                self.in_flight -= 1
+                self.__cond.notify()
+
+    def on_success(self):
+        with self.__cond:
+            # only grow while the limit is what holds requests back
+            if self.in_flight + 1 < int(self.limit):
+                return
+            if self.slow_start:
+                increase = 1
+            elif self.limit + 1 >= self.ceiling:
+                increase = 1 / (self.limit * self.probe_slowdown)
+            else:
+                increase = 1 / self.limit
+            self.limit = min(self.limit + increase, self.max_limit)
+            self.__cond.notify()
+
+    def on_overload(self, started: float, retry_after: float | None = None):
+        with self.__cond:
+            self.stats['overloads'] += 1
+            if retry_after:
+                self.__blocked_until = max(self.__blocked_until, time.monotonic() + min(retry_after, self.retry_after_max))
+            # requests sent before the last decrease report the same congestion, do not cut again
+            if started < self.__last_decrease:
+                return
+            self.slow_start = False
+            self.ceiling = self.limit
+            self.limit = max(self.limit * self.decrease, self.min_limit)
+            self.__last_decrease = time.monotonic()
+            logger.debug(f'concurrency limit decreased to {int(self.limit)}')
+
+
+def get_retry_after(resp: Response) -> float | None:
+    value = resp.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class HTTPSession:
+
+    # responses telling that the server (or the proxy in front of it) is overloaded or not available
+    OVERLOAD_STATUS = [429, 502, 503, 504]
+    # with these, the request was not processed and can be sent again whatever its method
+    RETRY_ANY_METHOD_STATUS = [429, 503]
+    IDEMPOTENT_METHODS = ['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE']
+
+    def __init__(
+            self,
+            pool_size: int = 10,
+            connect_timeout: float = 10,
+            read_timeout: float = 60,
+            retries: int = 3,
+            backoff_factor: float = 0.5,
+            max_concurrency: int = 32,
+            initial_concurrency: int = 4
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.max_concurrency = max_concurrency
+        self.initial_concurrency = initial_concurrency
+        # urllib3 retries connect errors for every method, as the request never reached the server;
+        # allowed_methods (idempotent ones by default) only limits read and status retries, so a sent POST is not replayed.
+        # Error responses are retried by request(), which also feeds them to the concurrency limiter
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=0,
+            backoff_factor=backoff_factor,
+            raise_on_status=False
+        )
+        self.__adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.__session = requests.Session()
+        self.__session.mount('http://', self.__adapter)
+        self.__session.mount('https://', self.__adapter)
+        self.__limiters = {}
+        self.__lock = threading.Lock()
+        self.__retried = 0
+
+    def get_limiter(self, url: str) -> ConcurrencyLimiter | None:
+        # each host gets its own limit; 0 disables limiting
+        if self.max_concurrency <= 0:
+            return None
+        host = urlparse(url).netloc
+        with self.__lock:
+            if host not in self.__limiters:
+                # more requests in flight than pooled connections would open throw-away connections
+                self.__limiters[host] = ConcurrencyLimiter(initial=self.initial_concurrency, max_limit=min(self.max_concurrency, self.pool_size))
+            return self.__limiters[host]
+
+    def __should_retry(self, method: str, status_code: int) -> bool:
+        if status_code in self.RETRY_ANY_METHOD_STATUS:
+            return True
+        return method.upper() in self.IDEMPOTENT_METHODS and status_code in self.OVERLOAD_STATUS + [500]
+
+    def request(self, method: str, url: str, **kwargs) -> Response:
+        kwargs.setdefault('timeout', self.timeout)
+        limiter = self.get_limiter(url)
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            slot = ExitStack()
+            if limiter:
+                slot.enter_context(limiter.slot())
+            try:
+                resp = self.__session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                slot.close()
+                get_metrics().observe_http(method, url, type(e).__name__, time.monotonic() - started)
+                if limiter and isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                    limiter.on_overload(started)
+                raise
+            except BaseException:
+                slot.close()
+                raise
+            if kwargs.get('stream'):
+                # a streamed body is still read from the connection; the slot is held until the response is closed
+                resp.close = self.__release_on_close(resp.close, slot)
+            else:
+                slot.close()
+            get_metrics().observe_http(method, url, resp.status_code, time.monotonic() - started)
+            retry_after = get_retry_after(resp) if resp.status_code in self.OVERLOAD_STATUS else None
+            if limiter:
+                if resp.status_code in self.OVERLOAD_STATUS:
+                    limiter.on_overload(started, retry_after)
+                else:
+                    limiter.on_success()
+            if attempt >= self.retries or not self.__should_retry(method, resp.status_code):
+                return resp
+            attempt += 1
+            with self.__lock:
+                self.__retried += 1
+            resp.close()
+            # with a limiter, Retry-After holds back every request to the host, not only this one
+            delay = min(retry_after, 60) if retry_after is not None and not limiter else \
+                random.uniform(0, self.backoff_factor * (2 ** attempt))
+            logger.debug(f'{method} {url} answered {resp.status_code}, retry {attempt}/{self.retries} in {delay:.2f}s')
+            time.sleep(delay)
+
+    @staticmethod
+    def __release_on_close(close: Callable[[], None], slot: ExitStack) -> Callable[[], None]:
+        def release():
+            try:
+                close()
+            finally:
+                slot.close()
+        return release
+
+    def get(self, url: str, **kwargs) -> Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> Response:
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> Response:
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> Response:
+        return self.request('DELETE', url, **kwargs)
+
+    def stats(self) -> dict:
+        num_connections = 0
+        num_requests = 0
+        pools = self.__adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            num_connections += pool.num_connections
+            num_requests += pool.num_requests
+        return {
+            'requests': num_requests,
+            'connections_new': num_connections,
+            'connections_reused': max(num_requests - num_connections, 0)
+        }
+
+    def limiter_stats(self) -> dict:
+        with self.__lock:
+            limiters = dict(self.__limiters)
+            retried = self.__retried
+        return {
+            'retried': retried,
+            'hosts': {
+                host: dict(limiter.stats, limit=int(limiter.limit))
+                for host, limiter in limiters.items()
+            }
+        }
+
+    def close(self):
+        self.__session.close()
+
+
+_http_session: HTTPSession | None = None
+
+def configure_http_session(**kwargs) -> HTTPSession:
+    global _http_session
+    if _http_session:
+        _http_session.close()
+    _http_session = HTTPSession(**kwargs)
+    return _http_session
+
+def get_http_session() -> HTTPSession:
+    global _http_session
+    if not _http_session:
+        _http_session = HTTPSession()
+    return _http_session
+
+
+def status_code_predicate(*status_codes: int) -> Callable[[Response], bool]:
+    def predicate(resp: Response) -> bool:
+        return resp.status_code in status_codes
+    return predicate
+
+
+def json_field_predicate(field: str, value, status_code: int = 200) -> Callable[[Response], bool]:
+    # field: dotted path into the JSON body, e.g. `project.frozen`
+    def predicate(resp: Response) -> bool:
+        if resp.status_code != status_code:
+            return False
+        try:
+            obj = resp.json()
+            for key in field.split('.'):
+                obj = obj.get(key)
+            return obj == value
+        except (ValueError, AttributeError):
+            return False
+    return predicate
+
+
+class ReadinessProbe:
+
+    def __init__(
+            self,
+            name: str,
+            url: str,
+            predicate: Callable[[Response], bool] | None = None,
+            timeout: float = 5,
+            max_attempts: int = -1
+    ):
+        self.name = name
+        self.url = url
+        self.predicate = predicate or status_code_predicate(200)
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+
+    def check(self, session: HTTPSession) -> bool:
+        try:
+            with session.get(self.url, timeout=self.timeout) as resp:
+                return self.predicate(resp)
+        except requests.RequestException as e:
+            logger.debug(f'{self.name} not ready: {e!r}')
+            return False
+
+
+def wait_for_endpoints(
+        probes: list,
+        deadline: float | None = 1200,
+        backoff_initial: float = 0.5,
+        backoff_max: float = 15,
+        session: HTTPSession | None = None
+) -> dict:
+    # a dedicated session without retries, so that every probe reports the current state
+    session = session or HTTPSession(pool_size=max(len(probes), 1), retries=0, max_concurrency=0)
+    started = time.monotonic()
+    end = started + deadline if deadline is not None else None
+
+    def wait(probe: ReadinessProbe) -> float:
+        attempt = 0
+        while not probe.check(session):
+            attempt += 1
+            if -1 < probe.max_attempts <= attempt:
+                raise Exception(f'{probe.name} ({probe.url}) not ready after {attempt} attempts')
+            if attempt == 1:
+                logger.info(f'waiting for {probe.name} to be ready')
+            # exponential backoff with full jitter, never sleeping past the deadline
+            delay = random.uniform(0, min(backoff_max, backoff_initial * 2 ** attempt))
+            if end is not None:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    raise Exception(f'{probe.name} ({probe.url}) not ready within {deadline}s')
+                delay = min(delay, remaining)
+            time.sleep(delay)
+        elapsed = time.monotonic() - started
+        logger.info(f'{probe.name} ready after {elapsed:.1f}s')
+        return elapsed
+
+    ready = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(len(probes), 1), thread_name_prefix='probe') as executor:
+        futures = {executor.submit(wait, probe): probe for probe in probes}
+        for future in as_completed(futures):
+            try:
+                ready[futures[future].name] = future.result()
+            except Exception as e:
+                logger.error(str(e))
+                failed.append(futures[future].name)
+    if failed:
+        raise Exception(f'endpoints not ready: {", ".join(failed)}')
+    return ready
+
+
+def get_jwt_exp(token: str) -> float | None:
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload))['exp']
+        return float(exp)
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def oidc_token_provider(oidc_account: str) -> Callable[[], str]:
+    def get_token():
+        logger.debug(f'requesting access token from oidc-agent (account: {oidc_account})')
+        p = subprocess.run(['oidc-token', oidc_account], capture_output=True, text=True)
+        if p.returncode != 0:
+            raise Exception(f'oidc-token failed with exit code {p.returncode}: {p.stderr.strip()}')
+        return p.stdout.strip()
+    return get_token
+
+
+class AccessTokenCache:
+
+    def __init__(
+            self,
+            provider: Callable[[], str],
+            file: str | None = None,
+            min_valid: float = 60,
+            default_ttl: float = 300
+    ):
+        self.provider = provider
+        self.file = file
+        self.min_valid = min_valid
+        self.default_ttl = default_ttl
+        self.__access_token = None
+        self.__exp = 0.0
+        self.__lock = threading.Lock()
+
+    def __is_valid(self, exp: float) -> bool:
+        return exp - self.min_valid > time.time()
+
+    def __load(self):
+        if not self.file or not os.path.isfile(self.file):
+            return None, 0.0
+        try:
+            with open(self.file, mode='r') as f:
+                cached = json.load(f)
+            return cached['access_token'], float(cached['exp'])
+        except (OSError, KeyError, TypeError, ValueError):
+            logger.warning(f'ignoring invalid access token cache file {self.file}')
+            return None, 0.0
+
+    def __store(self):
+        if not self.file:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.file)), exist_ok=True)
+        # the token grants access to the user's deployments; keep it readable by the owner only
+        write_file_atomic(self.file, json.dumps({'access_token': self.__access_token, 'exp': self.__exp}), mode=0o600)
+
+    def set_file(self, file: str | None):
+        with self.__lock:
+            self.file = file
+            if self.__access_token and self.__is_valid(self.__exp):
+                self.__store()
+
+    def get(self) -> str:
+        with self.__lock:
+            if self.__access_token and self.__is_valid(self.__exp):
+                return self.__access_token
+            access_token, exp = self.__load()
+            if access_token and self.__is_valid(exp):
+                logger.debug(f'access token loaded from {self.file}')
+                self.__access_token, self.__exp = access_token, exp
+                return access_token
+            access_token = self.provider()
+            exp = get_jwt_exp(access_token)
+            if exp is None:
+                exp = time.time() + self.default_ttl
+            self.__access_token, self.__exp = access_token, exp
+            self.__store()
+            return access_token
+
+    def invalidate(self):
+        with self.__lock:
+            self.__access_token = None
+            self.__exp = 0.0
+            if self.file and os.path.isfile(self.file):
+                os.remove(self.file)
 
 
 class PAPIClient:
@@ -75,18 +681,46 @@ class PAPIClient:
             oidc_account: str,
             tool_name: str = 'ai4os-nvflare',
             vo: str = 'vo.ai4eosc.eu',
+            session: HTTPSession | None = None,
+            token_provider: Callable[[], str] | None = None,
+            token_cache_file: str | None = None,
             **kwargs
     ):
         self.host = host.rstrip('/')
         self.oidc_account = oidc_account
         self.tool_name = tool_name
         self.vo = vo
+        self.session = session or get_http_session()
+        self.token_cache = AccessTokenCache(
+            provider=token_provider or oidc_token_provider(oidc_account),
+            file=token_cache_file
+        )
+        # the endpoints of a job do not change during its lifetime
+        self.__job_endpoints = {}
+        self.__lock = threading.Lock()
 
     def __get_access_token(self):
-        access_token = subprocess.run(['oidc-token', self.oidc_account], capture_output=True, text=True).stdout.strip()
+        access_token = self.token_cache.get()
         logger.debug(f'access-token: {access_token}')
         return access_token
 
+    def __request(self, method: str, url: str, headers: dict, **kwargs):
+        _headers = {
+            'Authorization': f'Bearer {self.__get_access_token()}',
+            'Content-Type': 'application/json'
+        }
+        _headers.update(headers)
+        logger.debug(f'headers: {_headers}')
+        resp = self.session.request(method, url, headers=_headers, **kwargs)
+        if resp.status_code == 401:
+            # token revoked or expired earlier than announced; get a fresh one and try once more
+            logger.debug('access token rejected by PAPI, refreshing')
+            resp.close()
+            self.token_cache.invalidate()
+            _headers['Authorization'] = f'Bearer {self.__get_access_token()}'
+            resp = self.session.request(method, url, headers=_headers, **kwargs)
+        return resp
+
     def get(
             self,
             path: str = '',
@@ -96,20 +730,14 @@ class PAPIClient:
         url = self.host + path
         logger.debug(f'url: {url}')
 
-        _headers = {
-            'Authorization': f'Bearer {self.__get_access_token()}',
-            'Content-Type': 'application/json'
-        }
-        _headers.update(headers)
-        logger.debug(f'headers: {_headers}')
-
         _params = {}
         _params.update(params)
         logger.debug(f'params: {_params}')
 
-        r = requests.get(
+        r = self.__request(
+            'GET',
             url,
-            headers=_headers,
+            headers=headers,
             params=_params,
         ).json()
         logger.debug(f'r:\n{json.dumps(r, indent=2)}')
@@ -125,13 +753,6 @@ class PAPIClient:
         url = self.host + path
         logger.debug(f'url: {url}')
 
-        _headers = {
-            'Authorization': f'Bearer {self.__get_access_token()}',
-            'Content-Type': 'application/json'
-        }
-        _headers.update(headers)
-        logger.debug(f'headers: {_headers}')
-
         _params = {}
         _params.update(params)
         logger.debug(f'params: {_params}')
@@ -140,15 +761,38 @@ class PAPIClient:
         _data.update(data)
         logger.debug(f'data: {_data}')
 
-        r = requests.post(
+        r = self.__request(
+            'POST',
             url,
-            headers=_headers,
+            headers=headers,
             params=_params,
             data=json.dumps(_data)
         ).json()
         logger.debug(f'r:\n{json.dumps(r, indent=2)}')
         return r
 
+    def delete(
+            self,
+            path: str = '',
+            headers: dict = {},
+            params: dict = {}
+    ):
+        url = self.host + path
+        logger.debug(f'url: {url}')
+
+        _params = {}
+        _params.update(params)
+        logger.debug(f'params: {_params}')
+
+        r = self.__request(
+            'DELETE',
+            url,
+            headers=headers,
+            params=_params,
+        ).json()
+        logger.debug(f'r:\n{json.dumps(r, indent=2)}')
+        return r
+
     def deploy_tool_nvflare(
             self,
             **cfg: dict
@@ -201,7 +845,7 @@ class PAPIClient:
             to_del_subconf.append(subconf)
             continue
           to_del = []
-          for k,v in data[subconf].items():
+          for k,v in list(data[subconf].items()):
             if k in kvmap[subconf].keys():
               if kvmap[subconf][k] == None:
                 to_del.append(k)
@@ -218,11 +862,12 @@ class PAPIClient:
           del data[subconf]
         logger.debug(f'data:\n{json.dumps(data, indent=2)}')
 
-        r = self.post(
-            path='/v1/deployments/tools/',
-            params=params,
-            data=data
-        )
+        with get_metrics().span('papi.deploy'):
+            r = self.post(
+                path='/v1/deployments/tools/',
+                params=params,
+                data=data
+            )
         if 'status' in r.keys() and r['status'] == 'success':
             return r['job_ID']
         raise Exception(r)
@@ -232,15 +877,107 @@ class PAPIClient:
             job_ID: str,
             full_info: bool = False
     ):
-        r = self.get(
-            path=f'/v1/deployments/tools/{job_ID}',
-            params={
-                'vo': self.vo,
-                'full_info': full_info
-            }
-        )
+        with self.__lock:
+            if not full_info and job_ID in self.__job_endpoints:
+                return dict(self.__job_endpoints[job_ID])
+        with get_metrics().span('papi.get_job_endpoints'):
+            r = self.get(
+                path=f'/v1/deployments/tools/{job_ID}',
+                params={
+                    'vo': self.vo,
+                    'full_info': full_info
+                }
+            )
+        if r.get('endpoints'):
+            with self.__lock:
+                self.__job_endpoints[job_ID] = dict(r['endpoints'])
         return r['endpoints']
 
+    def forget_job(self, job_ID: str):
+        with self.__lock:
+            self.__job_endpoints.pop(job_ID, None)
+
+    def delete_tool_nvflare(
+            self,
+            job_ID: str
+    ):
+        with get_metrics().span('papi.delete'):
+            r = self.delete(
+                path=f'/v1/deployments/tools/{job_ID}',
+                params={
+                    'vo': self.vo
+                }
+            )
+        self.forget_job(job_ID)
+        if 'status' in r.keys() and r['status'] == 'success':
+            return
+        raise Exception(r)
+
+
+class DashboardLoginCache:
+
+    def __init__(self, file: str | None = None, min_valid: float = 60, default_ttl: float = 900):
+        self.file = file
+        self.min_valid = min_valid
+        self.default_ttl = default_ttl
+        self.__logins = {}
+        self.__lock = threading.Lock()
+        self.__load()
+
+    @staticmethod
+    def __key(base_url: str, email: str) -> str:
+        return f'{base_url}|{email}'
+
+    def __load(self):
+        if not self.file or not os.path.isfile(self.file):
+            return
+        try:
+            with open(self.file, mode='r') as f:
+                self.__logins.update(json.load(f))
+        except (OSError, ValueError):
+            logger.warning(f'ignoring invalid login cache file {self.file}')
+
+    def __store(self):
+        if not self.file:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.file)), exist_ok=True)
+        write_file_atomic(self.file, json.dumps(self.__logins), mode=0o600)
+
+    def set_file(self, file: str | None):
+        with self.__lock:
+            self.file = file
+            self.__load()
+            self.__store()
+
+    def get(self, base_url: str, email: str) -> dict | None:
+        with self.__lock:
+            login = self.__logins.get(self.__key(base_url, email))
+        if login and login['exp'] - self.min_valid > time.time():
+            return login
+        return None
+
+    def put(self, base_url: str, email: str, access_token: str, user: dict):
+        exp = get_jwt_exp(access_token)
+        if exp is None:
+            exp = time.time() + self.default_ttl
+        with self.__lock:
+            self.__logins[self.__key(base_url, email)] = {'access_token': access_token, 'user': user, 'exp': exp}
+            self.__store()
+
+    def invalidate(self, base_url: str, email: str):
+        with self.__lock:
+            if self.__logins.pop(self.__key(base_url, email), None):
+                self.__store()
+
+
+_dashboard_login_cache: DashboardLoginCache | None = None
+
+def get_dashboard_login_cache() -> DashboardLoginCache:
+    global _dashboard_login_cache
+    if not _dashboard_login_cache:
+        _dashboard_login_cache = DashboardLoginCache()
+    return _dashboard_login_cache
+
 
 class NVFLDashboardClient:
 
@@ -249,17 +986,25 @@ class NVFLDashboardClient:
             base_url: str,
             username: str | None = None,
             password: str | None = None,
+            session: HTTPSession | None = None,
+            login_cache: DashboardLoginCache | None = None,
             **kwargs
     ):
         self.__base_url = base_url.rstrip('/') + '/'
+        self.session = session or get_http_session()
+        self.login_cache = login_cache or get_dashboard_login_cache()
+        self.__username = username
+        self.__password = password
+        self.__access_token = None
         if username and password:
-            self.__username = username
-            self.__password = password
             self.__access_token = self.login()
 
     def get_base_url(self):
         return self.__base_url
 
+    def get_username(self):
+        return self.__username
+
     def return_json_if_status_ok(self, resp: Response):
         if resp.status_code not in [200, 201]:
             raise Exception(resp)
@@ -268,21 +1013,38 @@ class NVFLDashboardClient:
             return resp_json
         raise Exception(resp_json)
 
-    def _get(
+    def _request(
             self,
-            path: str = {},
+            method: str,
+            path: str,
             access_token: str | None = None,
-            params: dict | None = {}
-    ):
+            **kwargs
+    ) -> Response:
         url = urljoin(self.get_base_url(), path.lstrip('/'))
         headers = {
             'Content-type': 'application/json'
         }
         if access_token:
             headers.update({'Authorization': f'Bearer {access_token}'})
-        resp = requests.get(
-            url=url,
-            headers=headers,
+        resp = self.session.request(method, url, headers=headers, **kwargs)
+        if resp.status_code == 401 and access_token and self.__username and self.__password:
+            # the (cached) access token is no longer accepted, log in again and repeat the request once
+            logger.debug(f'access token of {self.__username} rejected by NVFLARE Dashboard, logging in again')
+            resp.close()
+            headers.update({'Authorization': f'Bearer {self.login(force=True)}'})
+            resp = self.session.request(method, url, headers=headers, **kwargs)
+        return resp
+
+    def _get(
+            self,
+            path: str = {},
+            access_token: str | None = None,
+            params: dict | None = {}
+    ):
+        resp = self._request(
+            'GET',
+            path,
+            access_token=access_token,
             params=params
         )
         return self.return_json_if_status_ok(resp)
@@ -294,15 +1056,10 @@ class NVFLDashboardClient:
             req: dict = {},
             **kwargs
     ):
-        url = urljoin(self.get_base_url(), path.lstrip('/'))
-        headers = {
-            'Content-type': 'application/json'
-        }
-        if access_token:
-            headers.update({'Authorization': f'Bearer {access_token}'})
-        resp = requests.post(
-            url=url,
-            headers=headers,
+        resp = self._request(
+            'POST',
+            path,
+            access_token=access_token,
             data=json.dumps(req),
             **kwargs
         )
@@ -314,29 +1071,33 @@ class NVFLDashboardClient:
             access_token: str | None = None,
             req: dict = {}
     ):
-        url = urljoin(self.get_base_url(), path.lstrip('/'))
-        headers = {
-            'Content-type': 'application/json'
-        }
-        if access_token:
-            headers.update({'Authorization': f'Bearer {access_token}'})
-        resp = requests.patch(
-            url=url,
-            headers=headers,
+        resp = self._request(
+            'PATCH',
+            path,
+            access_token=access_token,
             data=json.dumps(req)
         )
         return self.return_json_if_status_ok(resp)
 
-    def login(self):
-        resp = self._post(
-            path='/api/v1/login',
-            req={
-                'email': self.__username,
-                'password': self.__password
-            }
-        )
+    def login(self, force: bool = False):
+        if not force:
+            cached = self.login_cache.get(self.get_base_url(), self.__username)
+            if cached:
+                logger.debug(f'reusing access token of {self.__username}')
+                self.__access_token = cached['access_token']
+                self.user = cached['user']
+                return self.__access_token
+        with get_metrics().span('dashboard.login'):
+            resp = self._post(
+                path='/api/v1/login',
+                req={
+                    'email': self.__username,
+                    'password': self.__password
+                }
+            )
         self.__access_token = resp['access_token']
         self.user = resp['user']
+        self.login_cache.put(self.get_base_url(), self.__username, self.__access_token, self.user)
         return self.__access_token
 
     def get_access_token(self):
@@ -353,17 +1114,18 @@ class NVFLDashboardClient:
             role: str,
             **kwargs
     ):
-        return self._post(
-            path='/api/v1/users',
-            req={
-                'email': email,
-                'name': name,
-                'password': password,
-                'confirm_password': password,
-                'organization': organization,
-                'role': role
-            }
-        )['user']
+        with get_metrics().span('dashboard.create_user'):
+            return self._post(
+                path='/api/v1/users',
+                req={
+                    'email': email,
+                    'name': name,
+                    'password': password,
+                    'confirm_password': password,
+                    'organization': organization,
+                    'role': role
+                }
+            )['user']
 
     def update_user(
             self,
@@ -382,7 +1144,8 @@ class NVFLDashboardClient:
             organization: str,
             capacity: dict | None = {},
             num_of_gpus: int | None = None,
-            mem_per_gpu_in_gib: int | None = None
+            mem_per_gpu_in_gib: int | None = None,
+            **kwargs
     ):
         _capacity = {
             'num_of_gpus': 0,
@@ -394,15 +1157,16 @@ class NVFLDashboardClient:
             _capacity.update({'num_of_gpus': num_of_gpus})
         if mem_per_gpu_in_gib:
             _capacity.update({'mem_per_gpu_in_gib': mem_per_gpu_in_gib})
-        return self._post(
-            path='/api/v1/clients',
-            access_token=self.get_access_token(),
-            req={
-                'name': name,
-                'organization': organization,
-                'capacity': _capacity
-            }
-        )['client']
+        with get_metrics().span('dashboard.create_client'):
+            return self._post(
+                path='/api/v1/clients',
+                access_token=self.get_access_token(),
+                req={
+                    'name': name,
+                    'organization': organization,
+                    'capacity': _capacity
+                }
+            )['client']
 
     def update_client(
             self,
@@ -451,20 +1215,56 @@ class NVFLDashboardClient:
             access_token=self.get_access_token()
         )['user_list']
 
-    def approve_users(self, users):
-        users_updated = []
-        for user in users:
-            user = self.update_user(
-                id=user['id'],
-                req={'approval_state': 100}
-            )
-            if user['approval_state'] != 100:
-                logger.error(f'could not approve user %s in NVFLARE Dashboard' % user['email'])
-                raise Exception()
-            logger.info('user %s approved in NVFLARE Dashboard' % user['email'])
-            users_updated.append(user)
-        logger.debug(f'users:\n{json.dumps(users_updated, indent=2)}')
-        return users_updated
+    def approve_many(
+            self,
+            objs: list,
+            update: Callable,
+            list_all: Callable,
+            parallel: int = 8
+    ) -> dict:
+        result = {
+            'approved': [],
+            'already_approved': [],
+            'failed': []
+        }
+        pending = []
+        for obj in objs:
+            if obj.get('approval_state') == 100:
+                result['already_approved'].append(obj)
+            else:
+                pending.append(obj)
+        if not pending:
+            return result
+        with get_metrics().span('dashboard.approve'):
+            return self.__approve_pending(pending, update, list_all, parallel, result)
+
+    def __approve_pending(self, pending: list, update: Callable, list_all: Callable, parallel: int, result: dict) -> dict:
+        errors = {}
+        with ThreadPoolExecutor(max_workers=max(parallel, 1), thread_name_prefix='approve') as executor:
+            futures = {executor.submit(update, id=obj['id'], req={'approval_state': 100}): obj for obj in pending}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors[futures[future]['id']] = e
+        # a single listing tells the state of all of them, instead of trusting each PATCH response
+        current = {obj['id']: obj for obj in list_all()}
+        for obj in pending:
+            obj = current.get(obj['id'], obj)
+            if obj.get('approval_state') == 100:
+                result['approved'].append(obj)
+            else:
+                if obj['id'] in errors:
+                    obj = dict(obj, error=repr(errors[obj['id']]))
+                result['failed'].append(obj)
+        return result
+
+    @staticmethod
+    def log_approval(result: dict, kind: str, key: str):
+        for obj in result['approved']:
+            logger.info('%s %s approved in NVFLARE Dashboard' % (kind, obj[key]))
+        for obj in result['failed']:
+            logger.error('could not approve %s %s in NVFLARE Dashboard%s' % (kind, obj[key], f": {obj['error']}" if 'error' in obj else ''))
 
     def create_clients(self, cfg):
         clients = []
@@ -475,20 +1275,6 @@ class NVFLDashboardClient:
         logger.debug(f'clients:\n{json.dumps(clients, indent=2)}')
         return clients
 
-    def approve_clients(self, clients):
-        clients_updated = []
-        for client in clients:
-            client = self.update_client(
-                id=client['id'],
-                req={'approval_state': 100}
-            )
-            if client['approval_state'] != 100:
-                logger.error(f'could not approve client %s in NVFLARE Dashboard' % client['name'])
-                raise Exception()
-            logger.info('client %s approved in NVFLARE Dashboard' % client['name'])
-            clients_updated.append(client)
-        return clients_updated
-
     def get_clients(self, org: str | None):
         clients = self._get(
             path='/api/v1/clients',
@@ -509,34 +1295,45 @@ class NVFLDashboardClient:
             filename: str | None = None,
             data: dict | None = {},
             access_token: str | None = None,
+            chunk_size: int = 1024 * 1024
     ):
-        url = urljoin(self.get_base_url(), path.lstrip('/'))
-        logger.debug('url=%s' % url)
-        headers = {
-            'Content-type': 'application/json'
-        }
-        if access_token:
-            headers.update({'Authorization': f'Bearer {access_token}'})
-        logger.debug('headers=%s' % str(headers))
-        resp = requests.post(
-            url=url,
-            headers=headers,
+        logger.debug('url=%s' % urljoin(self.get_base_url(), path.lstrip('/')))
+        with get_metrics().span('download'):
+            return self.__download_blob(path, dir, filename, data, access_token, chunk_size)
+
+    def __download_blob(self, path: str, dir: str, filename: str | None, data: dict | None, access_token: str | None, chunk_size: int):
+        resp = self._request(
+            'POST',
+            path,
+            access_token=access_token,
             data=json.dumps(data),
-            allow_redirects=True
+            allow_redirects=True,
+            stream=True
         )
-        if resp.status_code != 200:
-            raise Exception(resp.status_code)
-        header = resp.headers.get('Content-Disposition')
-        if header:
-            value, params = cgi.parse_header(header)
-            if value and params and value == 'attachment' and 'filename' in params:
-                filename = params['filename']
-        if not filename:
-            filename = tempfile.TemporaryFile(delete=False)
-        else:
-            filename = os.path.join(dir, filename)
-        with open(filename, mode='wb') as f:
-            f.write(resp.content)
+        with resp:
+            if resp.status_code != 200:
+                raise Exception(resp.status_code)
+            header = resp.headers.get('Content-Disposition')
+            if header:
+                value, params = cgi.parse_header(header)
+                if value and params and value == 'attachment' and 'filename' in params:
+                    filename = params['filename']
+            if not filename:
+                fd, filename = tempfile.mkstemp(dir=dir, suffix='.zip')
+                os.close(fd)
+            else:
+                filename = os.path.join(dir, filename)
+            # stream into a temp file next to the target and rename it afterwards, so that
+            # a partially downloaded kit never shows up under the final name
+            fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(filename) or None, prefix='.', suffix='.part')
+            try:
+                with os.fdopen(fd, mode='wb') as f:
+                    for chunk in resp.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                os.replace(tmp_filename, filename)
+            except BaseException:
+                os.remove(tmp_filename)
+                raise
         return filename
 
     def download_flare_console(
@@ -577,6 +1374,176 @@ class NVFLDashboardClient:
         return filename
 
 
+class ApprovalBatcher:
+
+    def __init__(self, approve_many: Callable[[list], dict]):
+        # approvals requested while a batch is in flight are approved together by the next batch, so
+        # concurrent callers (e.g. pipeline workers) share the PATCH round and one verification listing
+        self.__approve_many = approve_many
+        self.__cond = threading.Condition()
+        # id -> object, each id queued once however many callers wait for it
+        self.__queue = {}
+        self.__in_flight = set()
+        self.__busy = False
+        # id -> (outcome, object), kept until all its waiters have read it
+        self.__done = {}
+        self.__waiters = {}
+
+    def approve(self, objs: list) -> dict:
+        ids = list(dict.fromkeys(obj['id'] for obj in objs))
+        with self.__cond:
+            for obj in objs:
+                if obj['id'] not in self.__done and obj['id'] not in self.__in_flight:
+                    self.__queue.setdefault(obj['id'], obj)
+            for id in ids:
+                self.__waiters[id] = self.__waiters.get(id, 0) + 1
+            while not all(id in self.__done for id in ids):
+                if self.__busy:
+                    self.__cond.wait()
+                    continue
+                batch = list(self.__queue.values())
+                self.__queue = {}
+                self.__in_flight = {obj['id'] for obj in batch}
+                self.__busy = True
+                self.__cond.release()
+                try:
+                    result = self.__approve_many(batch)
+                except Exception as e:
+                    result = {'failed': [dict(obj, error=repr(e)) for obj in batch]}
+                finally:
+                    self.__cond.acquire()
+                    self.__busy = False
+                for outcome, batch_objs in result.items():
+                    for obj in batch_objs:
+                        self.__done[obj['id']] = (outcome, obj)
+                # every submitted object gets an outcome, or its waiters would wait for it forever
+                for obj in batch:
+                    if obj['id'] not in self.__done:
+                        self.__done[obj['id']] = ('failed', dict(obj, error='no approval outcome'))
+                self.__in_flight = set()
+                self.__cond.notify_all()
+            outcomes = {id: self.__done[id] for id in ids}
+            for id in ids:
+                self.__waiters[id] -= 1
+                if not self.__waiters[id]:
+                    del self.__waiters[id]
+                    del self.__done[id]
+        result = {'approved': [], 'already_approved': [], 'failed': []}
+        for obj in objs:
+            outcome, obj = outcomes[obj['id']]
+            result[outcome].append(obj)
+        return result
+
+
+class DashboardDirectory:
+
+    def __init__(self, project_admin: NVFLDashboardClient, max_age: float | None = None):
+        self.project_admin = project_admin
+        # listings older than max_age seconds are fetched again; None keeps them until invalidated
+        self.max_age = max_age
+        self.__users = None
+        self.__clients = None
+        self.__lock = threading.Lock()
+        self.__user_approvals = ApprovalBatcher(lambda users: project_admin.approve_many(
+            users, project_admin.update_user, lambda: self.get_users(since=time.monotonic())))
+        self.__client_approvals = ApprovalBatcher(lambda clients: project_admin.approve_many(
+            clients, project_admin.update_client, lambda: self.get_clients(since=time.monotonic())))
+
+    def __expired(self, listing: dict | None) -> bool:
+        return listing is None or (self.max_age is not None and time.monotonic() - listing['fetched'] > self.max_age)
+
+    @staticmethod
+    def __index(objs: list, key: str) -> dict:
+        index = {}
+        for obj in objs:
+            index.setdefault(obj[key], []).append(obj)
+        return index
+
+    def __get_users(self, since: float | None = None) -> dict:
+        with self.__lock:
+            if self.__expired(self.__users) or (since is not None and self.__users['fetched'] < since):
+                fetched = time.monotonic()
+                users = self.project_admin.get_users()
+                self.__users = {
+                    'fetched': fetched,
+                    'list': users,
+                    'email': {user['email']: user for user in users},
+                    'organization': self.__index(users, 'organization')
+                }
+            return self.__users
+
+    def __get_clients(self, since: float | None = None) -> dict:
+        with self.__lock:
+            if self.__expired(self.__clients) or (since is not None and self.__clients['fetched'] < since):
+                fetched = time.monotonic()
+                clients = self.project_admin.get_clients(org=None)
+                self.__clients = {
+                    'fetched': fetched,
+                    'list': clients,
+                    'name': {client['name']: client for client in clients},
+                    'organization': self.__index(clients, 'organization')
+                }
+            return self.__clients
+
+    def invalidate(self, users: bool = True, clients: bool = True):
+        with self.__lock:
+            if users:
+                self.__users = None
+            if clients:
+                self.__clients = None
+
+    def get_users(self, org: str | None = None, since: float | None = None) -> list:
+        # with since, the listing must have started after that time (time.monotonic()); callers waiting
+        # for the lock while it is fetched share it, so concurrent approvals are verified by one listing
+        if not org:
+            return list(self.__get_users(since)['list'])
+        return list(self.__get_users(since)['organization'].get(org, []))
+
+    def get_user_by_email(self, email: str) -> dict | None:
+        return self.__get_users()['email'].get(email)
+
+    def get_clients(self, org: str | None = None, since: float | None = None) -> list:
+        if not org:
+            return list(self.__get_clients(since)['list'])
+        return list(self.__get_clients(since)['organization'].get(org, []))
+
+    def approve_users(self, users: list) -> list:
+        return self.__approve(self.__user_approvals, users, 'user', 'email')
+
+    def approve_clients(self, clients: list) -> list:
+        return self.__approve(self.__client_approvals, clients, 'client', 'name')
+
+    def __approve(self, batcher: 'ApprovalBatcher', objs: list, kind: str, key: str) -> list:
+        result = batcher.approve(objs)
+        self.project_admin.log_approval(result, kind, key)
+        if result['failed']:
+            raise Exception('could not approve %ss in NVFLARE Dashboard: %s' % (kind, ', '.join(obj[key] for obj in result['failed'])))
+        approved = {obj['id']: obj for obj in result['approved'] + result['already_approved']}
+        return [approved[obj['id']] for obj in objs]
+
+    def get_client_by_name(self, name: str) -> dict | None:
+        return self.__get_clients()['name'].get(name)
+
+
+_dashboard_directories = {}
+_dashboard_directories_lock = threading.Lock()
+_dashboard_directory_max_age: float | None = None
+
+def configure_dashboard_directories(max_age: float | None = None):
+    global _dashboard_directory_max_age
+    with _dashboard_directories_lock:
+        _dashboard_directory_max_age = max_age
+        _dashboard_directories.clear()
+
+def get_dashboard_directory(project_admin: NVFLDashboardClient) -> DashboardDirectory:
+    # one directory per Dashboard and project admin, shared by all the commands of a process
+    key = (project_admin.get_base_url(), project_admin.get_username())
+    with _dashboard_directories_lock:
+        if key not in _dashboard_directories:
+            _dashboard_directories[key] = DashboardDirectory(project_admin, max_age=_dashboard_directory_max_age)
+        return _dashboard_directories[key]
+
+
 def do_start_job(papi: PAPIClient, **cfg: dict):
     # 1) deploy NVFL Dashboard and start FL server
     job_ID = papi.deploy_tool_nvflare(**cfg)
@@ -584,19 +1551,34 @@ def do_start_job(papi: PAPIClient, **cfg: dict):
     return job_ID
 
 
+def get_job_readiness_probes(nvfl_dashboard_endpoint: str, nvfl_server_jupyter_endpoint: str | None = None, ready: dict | None = None) -> list:
+    if ready:
+        # the scenario tells which Dashboard response means ready: {'path', 'field', 'value', 'status_code'}
+        url = nvfl_dashboard_endpoint.rstrip('/') + '/' + ready.get('path', '').lstrip('/')
+        predicate = json_field_predicate(ready['field'], ready.get('value', True), ready.get('status_code', 200))
+        probes = [ReadinessProbe('NVFLARE Dashboard', url, predicate=predicate)]
+    else:
+        probes = [ReadinessProbe('NVFLARE Dashboard', nvfl_dashboard_endpoint)]
+    if nvfl_server_jupyter_endpoint:
+        # JupyterLab redirects to its login page, which is followed
+        probes.append(ReadinessProbe('NVFLARE FL Server JupyterLab', nvfl_server_jupyter_endpoint))
+    return probes
+
 def init_nvfl_dashboard_client(
         endpoint: str,
         username: str,
-        password: str
+        password: str,
+        probes: list | None = None,
+        deadline: float | None = None
 ) -> NVFLDashboardClient:
-    wait_for_url(endpoint)
+    wait_for_endpoints(probes or get_job_readiness_probes(endpoint), deadline=deadline)
     return NVFLDashboardClient(endpoint, username, password)
 
 def get_org_users_cfg(org: str, org_cfg: dict):
-    return expand_vars_and_override(org_cfg['users'], org_cfg['override']['user'], {'{organization}': org})
+    return expand_vars_and_override(org_cfg.get('users', []), org_cfg.get('override', {}).get('user', {}), {'{organization}': org})
 
 def get_org_clients_cfg(org: str, org_cfg: dict):
-    return expand_vars_and_override(org_cfg['clients'], org_cfg['override']['client'], {'{organization}': org})
+    return expand_vars_and_override(org_cfg.get('clients', []), org_cfg.get('override', {}).get('client', {}), {'{organization}': org})
 
 def get_org_admin(users):
     for user in users:
@@ -611,39 +1593,460 @@ def get_user_password(users_cfg, user):
             return user_cfg['password']
     return None
 
-def init_organization(org, org_cfg, project_admin: NVFLDashboardClient):
-    users_cfg = get_org_users_cfg(org, org_cfg)
-    if len(users_cfg) < 1:
-        logger.error(f'missing users in organization {org} config')
-        raise Exception()
-    org_admin_cfg = get_org_admin(users_cfg)
-    users = project_admin.create_users(users_cfg)
-    users = project_admin.approve_users(users)
-    org_admin = NVFLDashboardClient(project_admin.get_base_url(), org_admin_cfg['email'], org_admin_cfg['password'])
-    clients_cfg = get_org_clients_cfg(org, org_cfg)
-    if len(clients_cfg) < 1:
-        logger.warning(f'missing clients in organization {org} config')
-    clients = org_admin.create_clients(clients_cfg)
-    clients = project_admin.approve_clients(clients)
-    return users, clients
-
-def do_scenario_init(nvfl_project_admin, cfg_scenario):
+class ScenarioPlan:
+
+    VERSION = 3
+
+    def __init__(self, plan: dict):
+        # plan: {'version', 'hash', 'organizations': [org, ...], 'users': [...], 'clients': [...], 'host': {...}, 'ready': {...} | None}
+        self.plan = plan
+        self.hash = plan['hash']
+        self.organizations = plan['organizations']
+        self.users = plan['users']
+        self.clients = plan['clients']
+        self.host = plan.get('host', {})
+        self.ready = plan.get('ready')
+        self.__clients_by_name = {client['name']: client for client in self.clients}
+        self.__users = {org: [] for org in self.organizations}
+        self.__clients = {org: [] for org in self.organizations}
+        self.__org_admins = {}
+        for user in self.users:
+            self.__users[user['organization']].append(user)
+            if user['role'] == 'org_admin':
+                self.__org_admins[user['organization']] = user
+        for client in self.clients:
+            self.__clients[client['organization']].append(client)
+
+    def get_users(self, org: str) -> list:
+        return self.__users[org]
+
+    def get_clients(self, org: str) -> list:
+        return self.__clients[org]
+
+    def get_org_admin(self, org: str) -> dict:
+        return self.__org_admins[org]
+
+    def get_client(self, name: str) -> dict | None:
+        return self.__clients_by_name.get(name)
+
+    def get_resources(self) -> dict:
+        # resource requests of the clients that have any
+        return {client['name']: client['resources'] for client in self.clients if client.get('resources')}
+
+    def to_dict(self) -> dict:
+        return self.plan
+
+    @classmethod
+    def compile(cls, cfg_scenario: dict, hash: str = '') -> 'ScenarioPlan':
+        errors = []
+        users = []
+        clients = []
+        emails = {}
+        client_names = {}
+        organizations = cfg_scenario.get('organizations') or {}
+        if not organizations:
+            errors.append('no organizations')
+        resources_cfg = cfg_scenario.get('resources') or {}
+        ready_cfg = cfg_scenario.get('ready')
+        if ready_cfg is not None:
+            if not isinstance(ready_cfg, dict) or not isinstance(ready_cfg.get('field'), str) or not ready_cfg['field']:
+                errors.append('ready must have a field')
+            elif not isinstance(ready_cfg.get('path', ''), str) or not isinstance(ready_cfg.get('status_code', 200), int):
+                errors.append('ready.path must be a string and ready.status_code an integer')
+        for org, org_cfg in organizations.items():
+            users_cfg = get_org_users_cfg(org, org_cfg)
+            clients_cfg = get_org_clients_cfg(org, org_cfg)
+            if len(users_cfg) < 1:
+                errors.append(f'missing users in organization {org}')
+            org_admins = [user_cfg.get('email') for user_cfg in users_cfg if user_cfg.get('role') == 'org_admin']
+            if len(users_cfg) > 0 and len(org_admins) != 1:
+                errors.append(f'organization {org} must have exactly one user with org_admin role, has {len(org_admins)}')
+            if len(clients_cfg) < 1:
+                logger.warning(f'missing clients in organization {org} config')
+            for i, user_cfg in enumerate(users_cfg):
+                user_cfg.setdefault('organization', org)
+                missing = [key for key in ('email', 'name', 'password', 'role') if not user_cfg.get(key)]
+                if missing:
+                    errors.append(f'user #{i + 1} of organization {org} is missing {", ".join(missing)}')
+                    continue
+                if user_cfg['organization'] != org:
+                    errors.append(f'user {user_cfg["email"]} of organization {org} has organization {user_cfg["organization"]}')
+                if user_cfg['email'] in emails:
+                    errors.append(f'duplicate user email {user_cfg["email"]} in organizations {emails[user_cfg["email"]]} and {org}')
+                emails[user_cfg['email']] = org
+                users.append(user_cfg)
+            for i, client_cfg in enumerate(clients_cfg):
+                client_cfg.setdefault('organization', org)
+                if not client_cfg.get('name'):
+                    errors.append(f'client #{i + 1} of organization {org} is missing name')
+                    continue
+                if client_cfg['organization'] != org:
+                    errors.append(f'client {client_cfg["name"]} of organization {org} has organization {client_cfg["organization"]}')
+                if client_cfg['name'] in client_names:
+                    errors.append(f'duplicate client name {client_cfg["name"]} in organizations {client_names[client_cfg["name"]]} and {org}')
+                client_names[client_cfg['name']] = org
+                # scenario defaults < organization < client
+                resources = dict(resources_cfg.get('client', {}))
+                resources.update(org_cfg.get('resources', {}))
+                resources.update(client_cfg.get('resources', {}))
+                if resources:
+                    for key in ('cpus', 'memory_GiB'):
+                        if not isinstance(resources.get(key, 0), int | float) or resources.get(key, 0) < 0:
+                            errors.append(f'client {client_cfg["name"]} has invalid resources.{key}: {resources[key]!r}')
+                    client_cfg['resources'] = resources
+                clients.append(client_cfg)
+        if errors:
+            for error in errors:
+                logger.error(f'scenario config: {error}')
+            raise Exception('invalid scenario config: %s' % '; '.join(errors))
+        return cls({
+            'version': cls.VERSION,
+            'hash': hash,
+            'organizations': list(organizations.keys()),
+            'users': users,
+            'clients': clients,
+            'host': resources_cfg.get('host', {}),
+            'ready': ready_cfg
+        })
+
+
+def get_scenario_hash(file: str, vars: dict = {}) -> str:
+    h = hashlib.sha256()
+    h.update(f'plan-v{ScenarioPlan.VERSION}\n'.encode('utf-8'))
+    h.update(json.dumps(vars, sort_keys=True).encode('utf-8'))
+    with open(file, mode='rb') as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+def load_scenario_plan(file: str, job_dir: str | None = None, vars: dict = {}) -> ScenarioPlan:
+    # the compiled plan is cached in the job dir and reused as long as the scenario config
+    # and the vars it was compiled with do not change
+    with get_metrics().span('scenario.plan'):
+        hash = get_scenario_hash(file, vars)
+        plan_file = os.path.join(job_dir, '.scenario-plan.json') if job_dir else None
+        if plan_file and os.path.isfile(plan_file):
+            try:
+                with open(plan_file, mode='r') as f:
+                    plan = json.load(f)
+                if plan.get('version') == ScenarioPlan.VERSION and plan.get('hash') == hash:
+                    logger.debug(f'loaded compiled scenario plan {hash[:12]} from {plan_file}')
+                    return ScenarioPlan(plan)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f'ignoring unreadable scenario plan {plan_file}: {e!r}')
+        plan = ScenarioPlan.compile(expand_vars(load_config(file=file), vars), hash=hash)
+        logger.info('compiled scenario plan %s: %d organizations, %d users, %d clients' % (
+            hash[:12], len(plan.organizations), len(plan.users), len(plan.clients)))
+        if plan_file:
+            os.makedirs(job_dir, exist_ok=True)
+            write_file_atomic(plan_file, json.dumps(plan.to_dict()), mode=0o600)
+        return plan
+
+def plan_organization(org, plan: ScenarioPlan, directory: DashboardDirectory | None = None):
+    # without a directory, nothing exists yet and everything is created
+    users_cfg = plan.get_users(org)
+    clients_cfg = plan.get_clients(org)
+    delta = {
+        'users': [],
+        'create_users': [],
+        'approve_users': [],
+        'clients': [],
+        'create_clients': [],
+        'approve_clients': []
+    }
+    for user_cfg in users_cfg:
+        user = directory.get_user_by_email(user_cfg['email']) if directory else None
+        if not user:
+            delta['create_users'].append(user_cfg)
+            continue
+        if user['organization'] != org:
+            raise Exception(f'user {user["email"]} already exists in organization {user["organization"]}')
+        if user['approval_state'] != 100:
+            delta['approve_users'].append(user)
+        else:
+            delta['users'].append(user)
+    for client_cfg in clients_cfg:
+        client = directory.get_client_by_name(client_cfg['name']) if directory else None
+        if not client:
+            delta['create_clients'].append(client_cfg)
+            continue
+        if client['organization'] != org:
+            raise Exception(f'client {client["name"]} already exists in organization {client["organization"]}')
+        if client['approval_state'] != 100:
+            delta['approve_clients'].append(client)
+        else:
+            delta['clients'].append(client)
+    return delta
+
+def do_scenario_init(nvfl_project_admin, plan: ScenarioPlan, parallel: int = 1, reconcile: bool = False, directory: DashboardDirectory | None = None):
+    directory = directory or DashboardDirectory(nvfl_project_admin)
+    failed = {}
+    deltas = {}
+    for org in plan.organizations:
+        try:
+            # with reconcile, the delta of every organization is computed from one listing of the whole Dashboard
+            deltas[org] = plan_organization(org, plan, directory if reconcile else None)
+        except Exception as e:
+            logger.error(f'initialization of organization {org} failed: {e!r}')
+            failed[org] = e
+            continue
+        if reconcile:
+            delta = deltas[org]
+            logger.info('organization %s: %d users to create, %d to approve; %d clients to create, %d to approve' % (
+                org, len(delta['create_users']), len(delta['approve_users']), len(delta['create_clients']), len(delta['approve_clients'])))
+
+    def for_each_org(func) -> dict:
+        # organizations are independent of each other; the project admin client is only read
+        # (base URL, access token) by the workers, so it can be shared among them
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(parallel, 1), thread_name_prefix='init-org') as executor:
+            futures = {org: executor.submit(func, org) for org in deltas if org not in failed}
+            for org, future in futures.items():
+                try:
+                    results[org] = future.result()
+                except Exception as e:
+                    logger.error(f'initialization of organization {org} failed: {e!r}')
+                    failed[org] = e
+        return results
+
+    def approve(kind: str, key: str, objs: list, update: Callable, list_all: Callable):
+        # the objects of all organizations are approved together and verified by a single listing
+        result = nvfl_project_admin.approve_many(objs, update, list_all)
+        nvfl_project_admin.log_approval(result, kind, key)
+        for obj in result['failed']:
+            failed.setdefault(obj['organization'], Exception(f'could not approve {kind} {obj[key]} in NVFLARE Dashboard'))
+
+    def create_clients(org):
+        if not deltas[org]['create_clients']:
+            return []
+        org_admin_cfg = plan.get_org_admin(org)
+        org_admin = NVFLDashboardClient(nvfl_project_admin.get_base_url(), org_admin_cfg['email'], org_admin_cfg['password'])
+        return org_admin.create_clients(deltas[org]['create_clients'])
+
+    created_users = for_each_org(lambda org: nvfl_project_admin.create_users(deltas[org]['create_users']))
+    users_created = time.monotonic() if any(created_users.values()) else None
+    approve('user', 'email', [user for org, users in created_users.items() for user in deltas[org]['approve_users'] + users],
+            nvfl_project_admin.update_user, lambda: directory.get_users(since=time.monotonic()))
+    # the org admins create the clients of their organizations once they are approved
+    created_clients = for_each_org(create_clients)
+    clients_created = time.monotonic() if any(created_clients.values()) else None
+    approve('client', 'name', [client for org, clients in created_clients.items() for client in deltas[org]['approve_clients'] + clients],
+            nvfl_project_admin.update_client, lambda: directory.get_clients(since=time.monotonic()))
+    # the verification listings show the Dashboard after all changes; a listing is fetched again only
+    # if something was created and nothing needed approval
     orgs = {}
-    for org, org_cfg in cfg_scenario['organizations'].items():
-        org_users, org_clients = init_organization(org, org_cfg, nvfl_project_admin)
-        orgs[org]={'users': org_users, 'clients': org_clients}
+    for org in plan.organizations:
+        if org in failed:
+            continue
+        users = {user['email']: user for user in directory.get_users(org=org, since=users_created)}
+        clients = {client['name']: client for client in directory.get_clients(org=org, since=clients_created)}
+        # keep the order of the scenario config
+        orgs[org] = {
+            'users': [users[user_cfg['email']] for user_cfg in plan.get_users(org) if user_cfg['email'] in users],
+            'clients': [clients[client_cfg['name']] for client_cfg in plan.get_clients(org) if client_cfg['name'] in clients]
+        }
+    if failed:
+        raise Exception(f'initialization failed for organizations: {", ".join(failed.keys())}')
     return orgs
 
-def unzip_file(file: str, dir: str, pin: str):
-    commands = [f'unzip -x -o -P {pin} {file} -d {dir}']
-    processes = [subprocess.Popen(cmd, shell=True) for cmd in commands]
-    # following code does not preserve file permissions
-    # with zipfile.ZipFile(file, 'r') as zip_ref:
-    #     logger.info(f'extracting {file} to {dir}')
-    #     zip_ref.extractall(dir, pwd=bytes(pin, 'utf-8'))
+def unzip_file(file: str, dir: str, pin: str) -> list:
+    with get_metrics().span('extract'):
+        return _unzip_file(file, dir, pin)
+
+def _unzip_file(file: str, dir: str, pin: str) -> list:
+    logger.debug(f'extracting {file} to {dir}')
+    extracted = []
+    dirs = []
+    with zipfile.ZipFile(file, 'r') as zip_ref:
+        for info in zip_ref.infolist():
+            # reading a member checks its CRC, so a corrupted or wrongly decrypted kit fails here
+            path = zip_ref.extract(info, dir, pwd=bytes(pin, 'utf-8'))
+            if not info.is_dir() and os.path.getsize(path) != info.file_size:
+                raise Exception(f'size mismatch of {info.filename} extracted from {file}')
+            # ZipFile.extract does not restore permissions; take the unix mode from the external attributes
+            mode = (info.external_attr >> 16) & 0o7777
+            if info.create_system == 3 and mode:
+                if info.is_dir():
+                    dirs.append((path, mode))
+                else:
+                    os.chmod(path, mode)
+            extracted.append(path)
+    # directories last, in case their mode does not allow writing into them
+    for path, mode in reversed(dirs):
+        os.chmod(path, mode)
+    return extracted
+
+
+def get_org_admin_clients(org, plan: ScenarioPlan, directory: DashboardDirectory):
+    org_admin_cfg = plan.get_org_admin(org)
+    org_admin = NVFLDashboardClient(directory.project_admin.get_base_url(), org_admin_cfg['email'], org_admin_cfg['password'])
+    return org_admin, directory.get_clients(org=org)
+
+
+class DownloadCache:
+
+    # fields of the Dashboard records a startup kit is generated from; counters and
+    # timestamps change with every download and are left out
+    RECORD_FIELDS = ['id', 'name', 'email', 'organization', 'role', 'capacity', 'approval_state']
+
+    def __init__(self, dir: str):
+        # kits are stored once per content hash in `objects/` and hard linked under their
+        # Content-Disposition file name; `.manifest.json` maps each kit to its hash and record
+        self.dir = dir
+        self.objects_dir = os.path.join(dir, 'objects')
+        self.manifest_file = os.path.join(dir, '.manifest.json')
+        self.stats = {'downloaded': 0, 'cached': 0, 'extracted': 0, 'up_to_date': 0}
+        self.__kits = {}
+        self.__lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.__load()
+
+    def __load(self):
+        try:
+            with open(self.manifest_file, mode='r') as f:
+                self.__kits = json.load(f).get('kits', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f'ignoring unreadable download manifest {self.manifest_file}: {e!r}')
+
+    def save(self):
+        with self.__lock:
+            write_file_atomic(self.manifest_file, json.dumps({'kits': self.__kits}, indent=1))
+
+    @classmethod
+    def record_hash(cls, record: dict) -> str:
+        record = {k: record[k] for k in cls.RECORD_FIELDS if k in record}
+        return hashlib.sha256(json.dumps(record, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def file_hash(file: str) -> str:
+        h = hashlib.sha256()
+        with open(file, mode='rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def object_file(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, f'{sha256}.zip')
+
+    @staticmethod
+    def __link(src: str, dst: str):
+        tmp = f'{dst}.link'
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+
+    def __add(self, key: str, file: str, record: str) -> str:
+        sha256 = self.file_hash(file)
+        obj = self.object_file(sha256)
+        # objects are linked and pruned under the lock, so an object is never removed while another kit takes it
+        with self.__lock:
+            if os.path.exists(obj):
+                # same content as before; the downloaded copy is replaced by a link to the object
+                self.__link(obj, file)
+            else:
+                self.__link(file, obj)
+            kit = self.__kits.setdefault(key, {})
+            previous = kit.get('sha256')
+            kit.update({
+                'sha256': sha256,
+                'filename': os.path.basename(file),
+                'size': os.path.getsize(obj),
+                'record': record,
+                'downloaded': time.time()
+            })
+            # the object of the replaced kit is removed once no other kit refers to it
+            if previous and previous != sha256 and not any(k.get('sha256') == previous for k in self.__kits.values()):
+                try:
+                    os.remove(self.object_file(previous))
+                except FileNotFoundError:
+                    pass
+        return file
+
+    def fetch(self, key: str, record: dict, download: Callable[[], str], force: bool = False) -> str:
+        # a kit is downloaded only if its Dashboard record changed or its file is gone, or if forced
+        record = self.record_hash(record)
+        # the object is checked and linked under the lock, __add may prune it otherwise
+        with self.__lock:
+            kit = self.__kits.get(key, {})
+            if not force and kit.get('record') == record and os.path.isfile(self.object_file(kit['sha256'])):
+                file = os.path.join(self.dir, kit['filename'])
+                if not os.path.isfile(file):
+                    self.__link(self.object_file(kit['sha256']), file)
+                self.stats['cached'] += 1
+                return file
+        file = self.__add(key, download(), record)
+        with self.__lock:
+            self.stats['downloaded'] += 1
+        return file
+
+    @staticmethod
+    def file_crc32(file: str) -> int:
+        crc = 0
+        with open(file, mode='rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                crc = zlib.crc32(chunk, crc)
+        return crc
+
+    @classmethod
+    def __tree_matches(cls, dir: str, files: dict) -> bool:
+        # files: {relative path: [size, CRC32 from the zip]}; the size is compared first as it is cheap
+        for name, value in files.items():
+            path = os.path.join(dir, name)
+            if not isinstance(value, list) or not os.path.isfile(path) or os.path.getsize(path) != value[0] or cls.file_crc32(path) != value[1]:
+                return False
+        return True
+
+    def extract(self, key: str, zip_file: str, dir: str, pin: str) -> bool:
+        # returns False if the extracted tree already matches the kit
+        with self.__lock:
+            kit = dict(self.__kits.get(key, {}))
+        extracted = kit.get('extracted', {})
+        if extracted.get('sha256') == kit.get('sha256') and extracted.get('dir') == dir and self.__tree_matches(dir, extracted.get('files', {})):
+            with self.__lock:
+                self.stats['up_to_date'] += 1
+            return False
+        paths = unzip_file(zip_file, dir=dir, pin=pin)
+        # the paths are returned in the order of the zip members, whose CRC32 was checked while extracting
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            infos = zip_ref.infolist()
+        files = {
+            os.path.relpath(path, dir): [info.file_size, info.CRC]
+            for info, path in zip(infos, paths)
+            if not info.is_dir()
+        }
+        with self.__lock:
+            self.__kits.setdefault(key, {})['extracted'] = {'sha256': kit.get('sha256'), 'dir': dir, 'files': files}
+            self.stats['extracted'] += 1
+        return True
 
+    def extracted_dirs(self, key: str | None = None) -> list:
+        # top-level directories of the extracted kits (or of a single one), e.g. `<job dir>/<org>/<client>`
+        with self.__lock:
+            kits = [self.__kits.get(key, {})] if key else list(self.__kits.values())
+            return sorted({
+                os.path.join(kit['extracted']['dir'], file.split(os.sep)[0])
+                for kit in kits if 'extracted' in kit
+                for file in kit['extracted'].get('files', {})
+            })
 
-def do_download_nvflare_scripts(project_admin, cfg_scenario, working_dir: str = os.path.curdir, download_dir: str = 'downloads', extract_dir: str = os.path.curdir, extract=True):
+    def format_stats(self) -> str:
+        with self.__lock:
+            return '%d downloaded, %d unchanged; %d extracted, %d up to date' % (
+                self.stats['downloaded'], self.stats['cached'], self.stats['extracted'], self.stats['up_to_date'])
+
+
+def get_console_cache_key(username: str) -> str:
+    return f'console:{username}'
+
+def get_client_cache_key(client: dict) -> str:
+    return f'client:{client["name"]}'
+
+
+def do_download_nvflare_scripts(project_admin, plan: ScenarioPlan, working_dir: str = os.path.curdir, download_dir: str = 'downloads', extract_dir: str = os.path.curdir, extract=True, parallel: int = 1, directory: DashboardDirectory | None = None, force_download: bool = False):
+    directory = directory or DashboardDirectory(project_admin)
     pin = '1234'
     if not os.path.isabs(extract_dir):
         extract_dir = os.path.join(working_dir, extract_dir)
@@ -652,24 +2055,305 @@ def do_download_nvflare_scripts(project_admin, cfg_scenario, working_dir: str =
         download_dir = os.path.join(working_dir, download_dir)
         download_dir = os.path.normpath(download_dir)
     os.makedirs(download_dir, exist_ok=True)
-    zip_flare_console = project_admin.download_flare_console(pin=pin, dir=download_dir)
-    logger.info(f'downloaded flare console: {zip_flare_console}')
     if extract:
         os.makedirs(extract_dir, exist_ok=True)
-        unzip_file(file=zip_flare_console, dir=extract_dir, pin=pin)
-    for org, org_cfg in cfg_scenario['organizations'].items():
-        users_cfg = get_org_users_cfg(org, org_cfg)
-        org_admin_cfg = get_org_admin(users_cfg)
-        org_admin = NVFLDashboardClient(project_admin.get_base_url(), org_admin_cfg['email'], org_admin_cfg['password'])
-        clients = org_admin.get_clients(org=org)
-        for client in clients:
-            zip_client_startup_script = org_admin.download_client_startup_kit(client['id'], dir=download_dir)
-            logger.info(f'downloaded startup script: {zip_client_startup_script}')
+    cache = DownloadCache(download_dir)
+    failed = []
+    extractions = {}
+    with ThreadPoolExecutor(max_workers=max(parallel, 1), thread_name_prefix='download') as executor, \
+            ThreadPoolExecutor(max_workers=max(parallel, 1), thread_name_prefix='extract') as extract_executor:
+        # the flare console, the org admin logins and all the client kits share one pool;
+        # client downloads are queued as soon as the client list of their organization is known
+        downloads = {
+            executor.submit(
+                cache.fetch, get_console_cache_key(project_admin.get_username()), project_admin.user,
+                lambda: project_admin.download_flare_console(pin=pin, dir=download_dir), force_download
+            ): ('flare console', get_console_cache_key(project_admin.get_username()), extract_dir)
+        }
+        listings = {
+            executor.submit(get_org_admin_clients, org, plan, directory): org
+            for org in plan.organizations
+        }
+        for future in as_completed(listings):
+            org = listings[future]
+            try:
+                org_admin, clients = future.result()
+            except Exception as e:
+                logger.error(f'could not list clients of organization {org}: {e!r}')
+                failed.append(org)
+                continue
+            for client in clients:
+                download = lambda org_admin=org_admin, client=client: org_admin.download_client_startup_kit(client['id'], dir=download_dir)
+                downloads[executor.submit(cache.fetch, get_client_cache_key(client), client, download, force_download)] = \
+                    (client['name'], get_client_cache_key(client), os.path.join(extract_dir, org))
+        for future in as_completed(downloads):
+            name, key, dir = downloads[future]
+            try:
+                zip_file = future.result()
+            except Exception as e:
+                logger.error(f'download of {name} failed: {e!r}')
+                failed.append(name)
+                continue
+            logger.info(f'startup kit of {name}: {zip_file}')
             if extract:
-                unzip_file(zip_client_startup_script, dir=os.path.join(extract_dir, org), pin=pin)
+                extractions[extract_executor.submit(cache.extract, key, zip_file, dir, pin)] = name
+        # wait for every kit to be extracted before returning, clients are started from the extracted trees
+        for future in as_completed(extractions):
+            name = extractions[future]
+            try:
+                extracted = future.result()
+            except Exception as e:
+                logger.error(f'extraction of {name} failed: {e!r}')
+                failed.append(name)
+                continue
+            logger.info(f'extracted {name}' if extracted else f'{name} already extracted')
+    cache.save()
+    logger.info(f'startup kits: {cache.format_stats()}')
+    if failed:
+        raise Exception(f'download or extraction failed for: {", ".join(failed)}')
+
 
+def get_container_name(client, client_name_prefix: str = '') -> str:
+    client_name_prefix = client_name_prefix.strip()
+    return (client_name_prefix + '_' if len(client_name_prefix) > 0 else '') + client['name']
+
+
+def get_containers(name_filter: str = '') -> dict:
+    # one query to the docker engine for all the containers of the job
+    cmd = ['docker', 'ps', '--all', '--no-trunc', '--format', '{{json .}}']
+    if name_filter:
+        cmd += ['--filter', f'name={name_filter}']
+    p = subprocess.run(cmd, capture_output=True, text=True)
+    if p.returncode != 0:
+        raise Exception(f'docker ps failed with exit code {p.returncode}: {p.stderr.strip()}')
+    containers = {}
+    for line in p.stdout.splitlines():
+        if not line.strip():
+            continue
+        container = json.loads(line)
+        state = container.get('State') or ('running' if container.get('Status', '').startswith('Up') else 'exited')
+        for name in container['Names'].split(','):
+            containers[name] = {'id': container.get('ID'), 'state': state, 'status': container.get('Status')}
+    return containers
+
+
+def remove_containers(names: list):
+    if not names:
+        return
+    p = subprocess.run(['docker', 'rm', '--force'] + names, capture_output=True, text=True)
+    if p.returncode != 0:
+        logger.warning(f'docker rm failed with exit code {p.returncode}: {p.stderr.strip()}')
+
+
+def stop_containers(name_prefix: str, parallel: int = 1) -> list:
+    # every container carrying the prefix is stopped, including those of clients no longer in the scenario
+    name_prefix = name_prefix.strip()
+    containers = get_containers(name_prefix)
+    names = [name for name in containers if name.startswith(name_prefix + '_')]
+    if not names:
+        return []
+    parallel = max(min(parallel, len(names)), 1)
+
+    def docker(cmd, names):
+        p = subprocess.run(['docker'] + cmd + names, capture_output=True, text=True)
+        if p.returncode != 0:
+            logger.warning(f'docker {cmd[0]} failed with exit code {p.returncode}: {p.stderr.strip()}')
+
+    running = [name for name in names if containers[name]['state'] == 'running']
+    with get_metrics().span('teardown.stop'):
+        with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='stop') as executor:
+            list(executor.map(lambda chunk: docker(['stop'], chunk), [running[i::parallel] for i in range(parallel) if running[i::parallel]]))
+    # containers run with `--rm` are gone once stopped, the others are removed
+    remaining = [name for name in get_containers(name_prefix) if name in names]
+    with get_metrics().span('teardown.remove'):
+        with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='remove') as executor:
+            list(executor.map(lambda chunk: docker(['rm', '--force'], chunk), [remaining[i::parallel] for i in range(parallel) if remaining[i::parallel]]))
+    return names
+
+
+def purge_job_files(job_dir: str, download_dir: str = 'downloads') -> list:
+    # the download manifest knows where the kits were extracted; client data and reports are kept
+    job_dir = os.path.realpath(job_dir)
+    download_dir = os.path.join(job_dir, download_dir)
+    dirs = DownloadCache(download_dir).extracted_dirs() if os.path.isdir(download_dir) else []
+    removed = []
+    for dir in dirs + [download_dir]:
+        dir = os.path.realpath(dir)
+        if dir == job_dir or os.path.commonpath([job_dir, dir]) != job_dir:
+            logger.warning(f'not removing {dir}, it is outside of the job directory {job_dir}')
+            continue
+        if os.path.isdir(dir):
+            shutil.rmtree(dir)
+            removed.append(dir)
+        # organization directories are left empty by their clients
+        parent = os.path.dirname(dir)
+        if parent != job_dir and os.path.isdir(parent) and not os.listdir(parent):
+            os.rmdir(parent)
+    # the compiled scenario plan holds the org admin passwords; it is compiled again on the next run
+    plan_file = os.path.join(job_dir, '.scenario-plan.json')
+    if os.path.isfile(plan_file):
+        os.remove(plan_file)
+        removed.append(plan_file)
+    return removed
+
+
+def do_teardown(job_ID: str, parallel: int = 1, purge: bool = False):
+    with get_metrics().span('phase.teardown'):
+        if shutil.which('docker'):
+            names = stop_containers(job_ID, parallel=parallel)
+            logger.info(f'stopped and removed {len(names)} containers of job {job_ID}')
+        else:
+            logger.warning('docker not found, no containers stopped')
+        if purge:
+            removed = purge_job_files(get_job_dir(job_ID))
+            logger.info(f'removed {len(removed)} startup kit directories and compiled scenario files of job {job_ID}')
 
-def start_client(client, working_dir, clients_dir, data_dir, client_name_prefix: str = ''):
+
+class DockerLaunchSpec:
+
+    # `docker run` options that do not take a value
+    FLAGS = {'-d', '--detach', '--rm', '-i', '--interactive', '-t', '--tty', '-it', '-ti', '--init', '--privileged', '-P', '--publish-all', '--read-only'}
+
+    def __init__(
+            self,
+            image: str,
+            name: str | None = None,
+            mounts: list = [],
+            env: list = [],
+            network: str | None = None,
+            workdir: str | None = None,
+            user: str | None = None,
+            flags: list = [],
+            options: list = [],
+            command: list = []
+    ):
+        self.image = image
+        self.name = name
+        self.mounts = list(mounts)
+        self.env = list(env)
+        self.network = network
+        self.workdir = workdir
+        self.user = user
+        self.flags = list(flags)
+        self.options = list(options)
+        self.command = list(command)
+
+    @classmethod
+    def from_args(cls, args: list):
+        spec = {'mounts': [], 'env': [], 'flags': [], 'options': []}
+        keys = {
+            '--name': 'name',
+            '-v': 'mounts', '--volume': 'mounts',
+            '-e': 'env', '--env': 'env',
+            '--net': 'network', '--network': 'network',
+            '-w': 'workdir', '--workdir': 'workdir',
+            '-u': 'user', '--user': 'user'
+        }
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if not arg.startswith('-'):
+                break
+            if arg in cls.FLAGS:
+                spec['flags'].append(arg)
+                i += 1
+                continue
+            if '=' in arg and arg.startswith('--'):
+                option, value = arg.split('=', 1)
+                i += 1
+            else:
+                if i + 1 >= len(args):
+                    raise Exception(f'missing value of docker run option {arg}')
+                option, value = arg, args[i + 1]
+                i += 2
+            key = keys.get(option)
+            if key in ['mounts', 'env']:
+                spec[key].append(value)
+            elif key:
+                spec[key] = value
+            else:
+                spec['options'] += [option, value]
+        if i >= len(args):
+            raise Exception('missing image in docker run command')
+        return cls(image=args[i], command=args[i + 1:], **spec)
+
+    def copy(self, **overrides):
+        spec = DockerLaunchSpec(**{k: getattr(self, k) for k in ['image', 'name', 'mounts', 'env', 'network', 'workdir', 'user', 'flags', 'options', 'command']})
+        for k in ['mounts', 'env', 'options']:
+            setattr(spec, k, getattr(spec, k) + overrides.pop(k, []))
+        for k, v in overrides.items():
+            setattr(spec, k, v)
+        return spec
+
+    def to_args(self) -> list:
+        args = ['docker', 'run'] + self.flags
+        if self.name:
+            args.append(f'--name={self.name}')
+        if self.user:
+            args += ['-u', self.user]
+        for mount in self.mounts:
+            args += ['-v', mount]
+        for env in self.env:
+            args += ['-e', env]
+        if self.workdir:
+            args += ['-w', self.workdir]
+        if self.network:
+            args.append(f'--net={self.network}')
+        return args + self.options + [self.image] + self.command
+
+
+def parse_docker_sh(file: str, vars: dict = {}) -> DockerLaunchSpec:
+    with open(file, mode='r') as f:
+        script = f.read().replace('\\\n', ' ')
+    shell_vars = {}
+    docker_run = None
+    for line in script.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        m = re.match(r'^([A-Za-z_][A-Za-z0-9_]*)=(.*)$', line)
+        if m:
+            try:
+                shell_vars[m.group(1)] = ' '.join(shlex.split(m.group(2), comments=True))
+            except ValueError:
+                logger.debug(f'skipping assignment in {file}: {line}')
+            continue
+        # the detached variant of `docker run`, as used by `docker.sh -d`
+        if re.match(r'^docker\s+run\s', line) and re.search(r'\s(-d|--detach)\s', line):
+            docker_run = line
+            break
+    if not docker_run:
+        raise Exception(f'no detached docker run command found in {file}')
+    shell_vars.update(vars)
+    docker_run = docker_run.replace('$(id -u)', str(os.getuid())).replace('$(id -g)', str(os.getgid()))
+    if '$(' in docker_run or '`' in docker_run:
+        raise Exception(f'unsupported command substitution in {file}')
+
+    def substitute(m):
+        name = m.group(1) or m.group(2)
+        return shell_vars.get(name, os.environ.get(name, ''))
+
+    # unquoted variables are split into words by shlex below, as the shell would do
+    docker_run = re.sub(r'\$\{([A-Za-z_][A-Za-z0-9_]*)\}|\$([A-Za-z_][A-Za-z0-9_]*)', substitute, docker_run)
+    return DockerLaunchSpec.from_args(shlex.split(docker_run)[2:])
+
+
+_launch_specs = {}
+_launch_specs_lock = threading.Lock()
+
+def load_launch_spec(client_startup_dir: str, vars: dict = {}) -> DockerLaunchSpec:
+    file = os.path.join(client_startup_dir, 'docker.sh')
+    key = (file, os.stat(file).st_mtime_ns, tuple(sorted(vars.items())))
+    with _launch_specs_lock:
+        spec = _launch_specs.get(key)
+    if not spec:
+        spec = parse_docker_sh(file, vars)
+        with _launch_specs_lock:
+            _launch_specs[key] = spec
+    return spec
+
+
+def start_client(client, working_dir, clients_dir, data_dir, client_name_prefix: str = '', overrides: dict | None = None) -> subprocess.CompletedProcess:
     if not os.path.isabs(working_dir):
         working_dir = os.path.abspath(working_dir)
     if not os.path.isabs(data_dir):
@@ -683,81 +2367,1516 @@ def start_client(client, working_dir, clients_dir, data_dir, client_name_prefix:
     client_dir = os.path.join(clients_dir, client['organization'], client['name'])
     client_startup_dir = os.path.join(client_dir, 'startup')
     logger.info('starting client %s with docker ...' % client['name'])
-    client_name_prefix = client_name_prefix.strip()
-    cmd = rf"sed -i -E 's/(docker\s+run\s+[^\n]+?--name)=({re.escape(client['name'])})/\1={client_name_prefix + '_' if len(client_name_prefix) > 0 else ''}\2/g' {client_dir}/startup/docker.sh && " + \
-        f'export MY_DATA_DIR={my_data_dir}; cd {working_dir}; mkdir -p $MY_DATA_DIR; cd {client_startup_dir}; ./docker.sh -d'
-    process = subprocess.Popen(cmd, shell=True)
+    # docker.sh of the kit is only read; the container name and any overrides are applied to the parsed spec
+    spec = load_launch_spec(client_startup_dir, {'DIR': client_startup_dir, 'MY_DATA_DIR': my_data_dir})
+    spec = spec.copy(name=get_container_name(client, client_name_prefix), **(overrides or {}))
+    logger.debug('docker run args: %s' % spec.to_args())
+    # `docker run -d` returns as soon as the container is created
+    with get_metrics().span('launch'):
+        p = subprocess.run(spec.to_args(), cwd=client_startup_dir, capture_output=True, text=True)
+    if p.returncode != 0:
+        logger.error('starting client %s failed with exit code %d: %s' % (client['name'], p.returncode, p.stderr.strip()))
+    return p
+
+
+def check_clients_running(clients: list, client_name_prefix: str = '') -> dict:
+    containers = get_containers(client_name_prefix.strip())
+    return {client['name']: containers.get(get_container_name(client, client_name_prefix)) for client in clients}
+
+
+GiB = 1024 ** 3
+
+def get_host_resources(host_cfg: dict = {}) -> dict:
+    # the scenario may set the budget explicitly; otherwise the CPUs this process may run on and the physical memory
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    cpus = float(host_cfg.get('cpus') or len(cores))
+    memory = float(host_cfg.get('memory_GiB', 0)) * GiB or float(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES'))
+    cpus -= float(host_cfg.get('reserved_cpus', 0))
+    memory -= float(host_cfg.get('reserved_memory_GiB', 0)) * GiB
+    # reserved cores are taken from the beginning, where the system usually runs
+    cores = cores[int(math.ceil(float(host_cfg.get('reserved_cpus', 0)))):]
+    return {'cpus': max(cpus, 0), 'memory': max(memory, 0), 'cores': cores}
+
+
+def get_container_cpusets(names: list) -> dict:
+    if not names:
+        return {}
+    p = subprocess.run(['docker', 'inspect', '--format', '{{.Name}} {{.HostConfig.CpusetCpus}}'] + names, capture_output=True, text=True)
+    cpusets = {}
+    for line in p.stdout.splitlines():
+        name, _, cpuset = line.strip().partition(' ')
+        cpusets[name.lstrip('/')] = parse_cpuset(cpuset)
+    return cpusets
+
+def parse_cpuset(value: str) -> list:
+    cores = []
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        first, _, last = part.partition('-')
+        cores += list(range(int(first), int(last or first) + 1))
+    return cores
+
+def format_cpuset(cores: list) -> str:
+    ranges = []
+    for core in sorted(cores):
+        if ranges and ranges[-1][1] == core - 1:
+            ranges[-1][1] = core
+        else:
+            ranges.append([core, core])
+    return ','.join(str(first) if first == last else f'{first}-{last}' for first, last in ranges)
+
+
+class PlacementScheduler:
+
+    def __init__(self, host: dict, resources: dict, client_name_prefix: str = '', poll_interval: float = 5, sync_interval: float = 1):
+        # host: get_host_resources(); resources: {client name: {'cpus', 'memory_GiB', 'cpuset'}}
+        # admit() syncs with docker when the last sync is older than sync_interval, so containers
+        # started meanwhile by another run or a watcher are accounted for
+        self.host = host
+        self.resources = resources
+        self.client_name_prefix = client_name_prefix
+        self.poll_interval = poll_interval
+        self.sync_interval = sync_interval
+        self.placements = {}
+        self.__starting = set()
+        self.__started = {}
+        self.__synced = float('-inf')
+        self.__lock = threading.Lock()
+        self.__sync_lock = threading.Lock()
+
+    def request(self, client: dict) -> dict:
+        resources = self.resources.get(client['name'], {})
+        return {
+            'cpus': float(resources.get('cpus', 0)),
+            'memory': float(resources.get('memory_GiB', 0)) * GiB,
+            'cpuset': bool(resources.get('cpuset', False))
+        }
 
+    def fits_host(self, client: dict) -> bool:
+        request = self.request(client)
+        return request['cpus'] <= self.host['cpus'] and request['memory'] <= self.host['memory'] and \
+            (not request['cpuset'] or math.ceil(request['cpus']) <= len(self.host['cores']))
+
+    def sync(self, containers: dict | None = None):
+        # running containers of the job hold their share of the host, including those started by earlier runs
+        synced = time.monotonic()
+        if containers is None:
+            containers = get_containers(self.client_name_prefix.strip())
+        running = {
+            name: client_name for client_name in self.resources
+            for name in [get_container_name({'name': client_name}, self.client_name_prefix)]
+            if containers.get(name, {}) and containers[name]['state'] == 'running'
+        }
+        with self.__lock:
+            unknown = [name for name, client_name in running.items() if client_name not in self.placements]
+        cpusets = get_container_cpusets(unknown)
+        with self.__lock:
+            for name, client_name in running.items():
+                if client_name not in self.placements:
+                    request = self.request({'name': client_name})
+                    self.placements[client_name] = dict(request, cores=cpusets.get(name, []), wave=0)
+            for client_name in list(self.placements):
+                # clients started after the snapshot was taken are not in it yet
+                if client_name not in running.values() and client_name not in self.__starting and self.__started.get(client_name, synced) <= synced:
+                    del self.placements[client_name]
+            self.__synced = max(self.__synced, synced)
+
+    def refresh(self):
+        # concurrent admits share one docker query
+        with self.__sync_lock:
+            if time.monotonic() - self.__synced >= self.sync_interval:
+                self.sync()
+
+    def __free(self) -> dict:
+        used_cores = {core for placement in self.placements.values() for core in placement['cores']}
+        return {
+            'cpus': self.host['cpus'] - sum(placement['cpus'] for placement in self.placements.values()),
+            'memory': self.host['memory'] - sum(placement['memory'] for placement in self.placements.values()),
+            'cores': [core for core in self.host['cores'] if core not in used_cores]
+        }
 
-def do_start_clients(cfg_scenario, nvfl_dashboard_endpoint, working_dir: str = os.path.curdir, clients_dir: str = os.path.curdir, data_dir: str = 'data', client_name_prefix: str = ''):
-    for org, org_cfg in cfg_scenario['organizations'].items():
-        users_cfg = expand_vars_and_override(org_cfg['users'], org_cfg['override']['user'], {'{organization}': org})
-        org_admin_cfg = get_org_admin(users_cfg)
-        org_admin = NVFLDashboardClient(nvfl_dashboard_endpoint, org_admin_cfg['email'], org_admin_cfg['password'])
-        clients = org_admin.get_clients(org=org)
+    def try_admit(self, client: dict, wave: int = 1) -> dict | None:
+        request = self.request(client)
+        with self.__lock:
+            free = self.__free()
+            num_cores = math.ceil(request['cpus']) if request['cpuset'] else 0
+            if request['cpus'] > free['cpus'] + 1e-9 or request['memory'] > free['memory'] or num_cores > len(free['cores']):
+                return None
+            placement = dict(request, cores=free['cores'][:num_cores], wave=wave)
+            self.placements[client['name']] = placement
+            self.__starting.add(client['name'])
+            return placement
+
+    def admit(self, client: dict, timeout: float = 0, wave: int = 1) -> dict | None:
+        deadline = time.monotonic() + timeout
+        while True:
+            self.refresh()
+            placement = self.try_admit(client, wave)
+            if placement or time.monotonic() + self.poll_interval > deadline:
+                return placement
+            time.sleep(self.poll_interval)
+
+    def started(self, client: dict, ok: bool = True):
+        with self.__lock:
+            self.__starting.discard(client['name'])
+            self.__started[client['name']] = time.monotonic()
+            if not ok:
+                self.placements.pop(client['name'], None)
+
+    @staticmethod
+    def get_overrides(placement: dict) -> dict:
+        options = []
+        if placement['cpus']:
+            options += ['--cpus', '%g' % placement['cpus']]
+        if placement['memory']:
+            options += ['--memory', '%dm' % (placement['memory'] // (1024 * 1024))]
+        if placement['cores']:
+            options += ['--cpuset-cpus', format_cpuset(placement['cores'])]
+        return {'options': options}
+
+    def plan_waves(self, clients: list) -> list:
+        # first-fit decreasing: the first wave gets what is left next to the running containers,
+        # the following ones the whole host
+        with self.__lock:
+            free = self.__free()
+        clients = sorted(clients, key=lambda client: (self.request(client)['cpus'], self.request(client)['memory']), reverse=True)
+        waves = [{'clients': [], 'cpus': 0.0, 'memory': 0.0, 'cores': 0}]
         for client in clients:
-            start_client(client, working_dir, clients_dir, data_dir, client_name_prefix=client_name_prefix)
-
-
-def main(args):
-    logger.setLevel(args.log_level)
+            request = self.request(client)
+            num_cores = math.ceil(request['cpus']) if request['cpuset'] else 0
+            for i, wave in enumerate(waves):
+                budget = free if i == 0 else self.host
+                if wave['cpus'] + request['cpus'] <= budget['cpus'] + 1e-9 and wave['memory'] + request['memory'] <= budget['memory'] \
+                        and wave['cores'] + num_cores <= len(budget['cores']):
+                    break
+            else:
+                wave = {'clients': [], 'cpus': 0.0, 'memory': 0.0, 'cores': 0}
+                waves.append(wave)
+            wave['clients'].append(client)
+            wave['cpus'] += request['cpus']
+            wave['memory'] += request['memory']
+            wave['cores'] += num_cores
+        # the first wave stays empty if the running containers leave no room
+        return waves
+
+
+def print_packing(scheduler: PlacementScheduler, waves: list, file=sys.stdout):
+    print('host: %.1f CPUs, %.1f GiB memory, %d cores for cpusets' % (
+        scheduler.host['cpus'], scheduler.host['memory'] / GiB, len(scheduler.host['cores'])), file=file)
+    running = [placement for placement in scheduler.placements.values() if placement['wave'] == 0]
+    if running:
+        print('already running: %d clients, %.1f CPUs, %.1f GiB' % (
+            len(running), sum(p['cpus'] for p in running), sum(p['memory'] for p in running) / GiB), file=file)
+    for i, wave in enumerate(waves):
+        print('wave %d: %d clients, %.1f CPUs, %.1f GiB' % (i + 1, len(wave['clients']), wave['cpus'], wave['memory'] / GiB), file=file, flush=True)
+
+
+def print_table(rows: list, file=sys.stdout):
+    # the first row is the header
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    line = '-' * (sum(widths) + 3 * len(widths) + 1)
+    print(line, file=file)
+    for i, row in enumerate(rows):
+        print('| ' + ' | '.join(value.ljust(widths[j]) for j, value in enumerate(row)) + ' |', file=file)
+        if i == 0:
+            print(line, file=file)
+    print(line, file=file, flush=True)
+
+
+def print_launch_summary(result: dict, file=sys.stdout):
+    rows = [('CLIENT', 'CONTAINER', 'RESULT', 'STATE', 'EXIT CODE', 'WAVE', 'CPUS', 'MEMORY', 'CPUSET')]
+    for outcome in ['started', 'already_running', 'queued', 'failed']:
+        for entry in result[outcome]:
+            placement = entry.get('placement')
+            rows.append((
+                entry['client'],
+                entry['container'],
+                outcome.replace('_', ' '),
+                entry.get('state') or '-',
+                str(entry['exit_code']) if entry.get('exit_code') is not None else '-',
+                str(placement['wave']) if placement else '-',
+                '%g' % placement['cpus'] if placement and placement['cpus'] else '-',
+                '%.1fG' % (placement['memory'] / GiB) if placement and placement['memory'] else '-',
+                format_cpuset(placement['cores']) if placement and placement['cores'] else '-'
+            ))
+    print_table(rows, file=file)
+
+
+def launch_one(client, working_dir, clients_dir, data_dir, client_name_prefix: str = '', scheduler: PlacementScheduler | None = None,
+               admit_timeout: float = 0, wave: int = 1, stale: bool = False) -> tuple:
+    # returns (placement, process); the process is None if the client waits for capacity
+    if stale:
+        # a left-over container would make `docker run --name` fail
+        remove_containers([get_container_name(client, client_name_prefix)])
+    placement = None
+    overrides = None
+    if scheduler:
+        placement = scheduler.admit(client, timeout=admit_timeout, wave=wave)
+        if not placement:
+            return None, None
+        overrides = scheduler.get_overrides(placement)
+    p = None
+    try:
+        p = start_client(client, working_dir, clients_dir, data_dir, client_name_prefix=client_name_prefix, overrides=overrides)
+    finally:
+        # a failed launch gives its reservation back
+        if scheduler:
+            scheduler.started(client, ok=p is not None and p.returncode == 0)
+    return placement, p
+
+
+def launch_clients(clients: list, working_dir, clients_dir, data_dir, client_name_prefix: str = '', parallel: int = 1,
+                   scheduler: PlacementScheduler | None = None, admit_timeout: float = 0) -> dict:
+    result = {
+        'started': [],
+        'already_running': [],
+        'queued': [],
+        'failed': []
+    }
+    containers = get_containers(client_name_prefix.strip())
+    to_start = []
+    stale = []
+    for client in clients:
+        name = get_container_name(client, client_name_prefix)
+        container = containers.get(name)
+        if container and container['state'] == 'running':
+            result['already_running'].append({'client': client['name'], 'container': name, 'state': container['state']})
+            continue
+        if container:
+            stale.append(name)
+        to_start.append(client)
+    placements = {}
+    if scheduler:
+        scheduler.sync()
+        unschedulable = [client for client in to_start if not scheduler.fits_host(client)]
+        for client in unschedulable:
+            logger.error(f'client {client["name"]} requests more resources than the host has')
+            result['failed'].append({'client': client['name'], 'container': get_container_name(client, client_name_prefix), 'state': None, 'exit_code': None})
+        to_start = [client for client in to_start if client not in unschedulable]
+        waves = scheduler.plan_waves(to_start)
+        print_packing(scheduler, waves)
+        # clients are admitted wave by wave; later waves wait up to admit_timeout for running clients to free the host
+        to_start = [(client, i + 1) for i, wave in enumerate(waves) for client in wave['clients']]
+    else:
+        to_start = [(client, None) for client in to_start]
+
+    def launch(client, wave):
+        placement, p = launch_one(client, working_dir, clients_dir, data_dir, client_name_prefix=client_name_prefix, scheduler=scheduler,
+                                  admit_timeout=admit_timeout if wave and wave > 1 else 0, wave=wave or 1,
+                                  stale=get_container_name(client, client_name_prefix) in stale)
+        if placement:
+            placements[client['name']] = placement
+        return p
+
+    exit_codes = {}
+    queued = []
+    with ThreadPoolExecutor(max_workers=max(parallel, 1), thread_name_prefix='launch') as executor:
+        futures = {
+            executor.submit(launch, client, wave): client
+            for client, wave in to_start
+        }
+        for future in as_completed(futures):
+            client = futures[future]
+            try:
+                p = future.result()
+            except Exception as e:
+                logger.error(f'starting client {client["name"]} failed: {e!r}')
+                exit_codes[client['name']] = None
+                continue
+            if p is None:
+                queued.append(client)
+                continue
+            exit_codes[client['name']] = p.returncode
+    for client in queued:
+        result['queued'].append({'client': client['name'], 'container': get_container_name(client, client_name_prefix), 'state': None, 'exit_code': None})
+    to_start = [client for client, _ in to_start if client not in queued]
+    containers = check_clients_running(to_start, client_name_prefix) if to_start else {}
+    for client in to_start:
+        name = get_container_name(client, client_name_prefix)
+        container = containers.get(client['name'])
+        entry = {
+            'client': client['name'],
+            'container': name,
+            'state': container['state'] if container else None,
+            'exit_code': exit_codes.get(client['name']),
+            'placement': placements.get(client['name'])
+        }
+        if entry['exit_code'] == 0 and entry['state'] == 'running':
+            result['started'].append(entry)
+        else:
+            result['failed'].append(entry)
+    return result
+
+
+def get_placement_scheduler(plan: ScenarioPlan, client_name_prefix: str = '') -> PlacementScheduler | None:
+    # clients are placed only if the scenario requests resources for any of them
+    resources = plan.get_resources()
+    if not resources:
+        return None
+    return PlacementScheduler(get_host_resources(plan.host), resources, client_name_prefix)
+
+
+def do_start_clients(plan: ScenarioPlan, directory: DashboardDirectory, working_dir: str = os.path.curdir, clients_dir: str = os.path.curdir, data_dir: str = 'data', client_name_prefix: str = '', parallel: int = 1, admit_timeout: float = 0):
+    clients = []
+    for org in plan.organizations:
+        clients += directory.get_clients(org=org)
+    scheduler = get_placement_scheduler(plan, client_name_prefix)
+    result = launch_clients(clients, working_dir, clients_dir, data_dir, client_name_prefix=client_name_prefix, parallel=parallel, scheduler=scheduler, admit_timeout=admit_timeout)
+    print_launch_summary(result)
+    if result['queued']:
+        logger.warning('%d clients queued, the host is full; run --start again when resources are free, or use --admit-timeout' % len(result['queued']))
+    if result['failed']:
+        raise Exception('could not start clients: %s' % ', '.join(entry['client'] for entry in result['failed']))
+    return result
+
+
+def get_exit_code(status: str | None) -> int | None:
+    # `docker ps` gives the exit code only in the status text, e.g. `Exited (137) 5 seconds ago`
+    m = re.match(r'Exited \((-?\d+)\)', status or '')
+    return int(m.group(1)) if m else None
+
+
+class ClientWatcher:
+
+    # a client restarted flap_limit times within this many seconds is flagged as flapping and left down
+    FLAP_WINDOW = 600
+
+    def __init__(self, clients: list, working_dir: str, clients_dir: str = os.path.curdir, data_dir: str = 'data', client_name_prefix: str = '',
+                 scheduler: PlacementScheduler | None = None, parallel: int = 1, interval: float = 10, max_backoff: float = 300,
+                 flap_limit: int = 5, status_file: str | None = None):
+        self.clients = {client['name']: client for client in clients}
+        self.working_dir = working_dir
+        self.clients_dir = clients_dir
+        self.data_dir = data_dir
+        self.client_name_prefix = client_name_prefix
+        self.scheduler = scheduler
+        self.parallel = parallel
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.flap_limit = flap_limit
+        self.status_file = status_file
+        self.status = {
+            name: {
+                'container': get_container_name(client, client_name_prefix),
+                'state': None,
+                'status': None,
+                'exit_code': None,
+                'running_since': None,
+                'restarts': 0,
+                'failures': 0,
+                'last_restart': None,
+                'next_restart': None,
+                'flapping': False
+            }
+            for name, client in self.clients.items()
+        }
+        self.__restart_times = {name: deque() for name in self.clients}
+        self.__stopped = threading.Event()
+
+    def stop(self):
+        self.__stopped.set()
+
+    def get_backoff(self, failures: int) -> float:
+        # the first restart is immediate, the following ones back off exponentially up to max_backoff
+        if failures == 0:
+            return 0
+        return min(self.interval * 2 ** (failures - 1), self.max_backoff)
+
+    def poll(self) -> list:
+        now = time.time()
+        with get_metrics().span('watch.poll'):
+            containers = get_containers(self.client_name_prefix.strip())
+        due = []
+        for name, status in self.status.items():
+            container = containers.get(status['container'])
+            state = container['state'] if container else 'missing'
+            if state != status['state']:
+                if state == 'running':
+                    logger.info(f'client {name} is running')
+                elif status['state'] == 'running' or status['state'] is None:
+                    exit_code = get_exit_code(container['status']) if container else None
+                    logger.warning(f'client {name} is {state}' + (f', exit code {exit_code}' if exit_code is not None else ''))
+            status['state'] = state
+            status['status'] = container['status'] if container else None
+            if state == 'running':
+                if status['running_since'] is None:
+                    status['running_since'] = now
+                # a container that stays up as long as the longest backoff is healthy again
+                if status['failures'] and now - status['running_since'] >= self.max_backoff:
+                    status['failures'] = 0
+                if status['flapping']:
+                    logger.info(f'client {name} is no longer flapping')
+                    status['flapping'] = False
+                    self.__restart_times[name].clear()
+                status['next_restart'] = None
+                continue
+            status['running_since'] = None
+            if container:
+                status['exit_code'] = get_exit_code(container['status'])
+            # restarting and paused containers are left to the docker engine
+            if state not in ['exited', 'dead', 'missing', 'created'] or status['flapping']:
+                continue
+            restart_times = self.__restart_times[name]
+            while restart_times and now - restart_times[0] > self.FLAP_WINDOW:
+                restart_times.popleft()
+            if len(restart_times) >= self.flap_limit:
+                status['flapping'] = True
+                logger.error(f'client {name} is flapping: restarted {len(restart_times)} times within {self.FLAP_WINDOW}s, it is not restarted again until it runs')
+                continue
+            if status['next_restart'] is None:
+                status['next_restart'] = now + self.get_backoff(status['failures'])
+            if now >= status['next_restart']:
+                due.append(name)
+        if due:
+            self.restart(due, containers)
+        self.write_status()
+        return due
+
+    def restart(self, names: list, containers: dict):
+        if self.scheduler:
+            self.scheduler.sync(containers)
+
+        def restart_one(name):
+            with get_metrics().span('watch.restart'):
+                _, p = launch_one(self.clients[name], self.working_dir, self.clients_dir, self.data_dir, client_name_prefix=self.client_name_prefix,
+                                  scheduler=self.scheduler, stale=self.status[name]['state'] != 'missing')
+            return p
+
+        with ThreadPoolExecutor(max_workers=max(self.parallel, 1), thread_name_prefix='restart') as executor:
+            futures = {executor.submit(restart_one, name): name for name in names}
+            for future in as_completed(futures):
+                name = futures[future]
+                status = self.status[name]
+                try:
+                    p = future.result()
+                    if p is None:
+                        # the client waits for capacity, which is not a failure of the client
+                        status['state'] = 'queued'
+                        continue
+                except Exception as e:
+                    logger.error(f'restarting client {name} failed: {e!r}')
+                    p = None
+                now = time.time()
+                status['restarts'] += 1
+                status['failures'] += 1
+                status['last_restart'] = now
+                status['next_restart'] = None
+                self.__restart_times[name].append(now)
+                if p is not None and p.returncode == 0:
+                    logger.info(f'client {name} restarted ({status["restarts"]} restarts, next backoff {self.get_backoff(status["failures"]):g}s)')
+
+    def summary(self) -> dict:
+        summary = {'running': 0, 'down': 0, 'queued': 0, 'flapping': 0}
+        for status in self.status.values():
+            if status['flapping']:
+                summary['flapping'] += 1
+            elif status['state'] == 'running':
+                summary['running'] += 1
+            elif status['state'] == 'queued':
+                summary['queued'] += 1
+            else:
+                summary['down'] += 1
+        return summary
+
+    def write_status(self):
+        if not self.status_file:
+            return
+        content = json.dumps({
+            'updated': time.time(),
+            'interval': self.interval,
+            'summary': self.summary(),
+            'clients': self.status
+        }, indent=2)
+        write_file_atomic(self.status_file, content)
+
+    def run(self, duration: float | None = None):
+        deadline = time.monotonic() + duration if duration else None
+        last_summary = None
+        logger.info(f'watching {len(self.clients)} clients every {self.interval:g}s')
+        while not self.__stopped.is_set():
+            started = time.monotonic()
+            try:
+                self.poll()
+            except Exception as e:
+                # a failed docker query is retried at the next interval
+                logger.error(f'watch poll failed: {e!r}')
+            summary = self.summary()
+            if summary != last_summary:
+                logger.info('watch: ' + ', '.join(f'{count} {name}' for name, count in summary.items()))
+                last_summary = summary
+            if deadline and time.monotonic() >= deadline:
+                break
+            timeout = self.interval - (time.monotonic() - started)
+            if deadline:
+                timeout = min(timeout, deadline - time.monotonic())
+            self.__stopped.wait(max(timeout, 0))
+        logger.info('watch stopped')
+
+
+def do_watch_clients(plan: ScenarioPlan, working_dir: str, client_name_prefix: str = '', parallel: int = 1, interval: float = 10,
+                     max_backoff: float = 300, flap_limit: int = 5, duration: float | None = None):
+    # the extracted startup kits are all that is needed to restart the clients, the NVFLARE Dashboard is not queried
+    watcher = ClientWatcher(
+        plan.clients,
+        working_dir,
+        client_name_prefix=client_name_prefix,
+        scheduler=get_placement_scheduler(plan, client_name_prefix),
+        parallel=parallel,
+        interval=interval,
+        max_backoff=max_backoff,
+        flap_limit=flap_limit,
+        status_file=os.path.join(working_dir, 'watch-status.json')
+    )
+    handler = signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    try:
+        watcher.run(duration)
+    except KeyboardInterrupt:
+        logger.info('watch interrupted')
+    finally:
+        signal.signal(signal.SIGTERM, handler)
+        watcher.write_status()
+    return watcher
+
+
+class Pipeline:
+
+    def __init__(self, stages: list):
+        # stages: [(name, func, workers), ...]; func takes an item and returns the items for the next stage
+        self.stages = stages
+        self.__executors = [
+            ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix=f'pipeline-{name}')
+            for name, _, workers in stages
+        ]
+        self.__stats = {name: {'queued': 0, 'running': 0, 'done': 0, 'failed': 0} for name, _, _ in stages}
+        self.__pending = 0
+        self.__cond = threading.Condition()
+        self.started = time.monotonic()
+        self.first_completed = None
+        self.completed = []
+        self.failed = []
+
+    def submit(self, item, stage: int = 0):
+        name = self.stages[stage][0]
+        with self.__cond:
+            self.__pending += 1
+            self.__stats[name]['queued'] += 1
+        self.__executors[stage].submit(self.__run, item, stage)
+
+    def __run(self, item, stage: int):
+        name, func, _ = self.stages[stage]
+        with self.__cond:
+            self.__stats[name]['queued'] -= 1
+            self.__stats[name]['running'] += 1
+        try:
+            next_items = func(item) or []
+            result = 'done'
+        except Exception as e:
+            logger.error(f'pipeline stage {name} failed for {item.get("name")}: {e!r}')
+            next_items = []
+            result = 'failed'
+            with self.__cond:
+                self.failed.append((name, item, e))
+        # next items are queued before this one is released, so the pending count never drops to zero early
+        for next_item in next_items:
+            if stage + 1 < len(self.stages):
+                self.submit(next_item, stage + 1)
+        with self.__cond:
+            self.__stats[name]['running'] -= 1
+            self.__stats[name][result] += 1
+            if stage + 1 == len(self.stages) and next_items:
+                self.completed.extend(next_items)
+                if self.first_completed is None:
+                    self.first_completed = time.monotonic() - self.started
+            self.__pending -= 1
+            self.__cond.notify_all()
+
+    def stats(self) -> dict:
+        with self.__cond:
+            return {name: dict(stats) for name, stats in self.__stats.items()}
+
+    def format_stats(self) -> str:
+        return ' | '.join(
+            '%s: %d queued, %d running, %d done, %d failed' % (name, st['queued'], st['running'], st['done'], st['failed'])
+            for name, st in self.stats().items()
+        )
 
-    cfg_papi = load_config(file=args.cfg_papi)
-    cfg_job = load_config(file=args.cfg_job)
+    def join(self, report_interval: float = 5):
+        with self.__cond:
+            while self.__pending > 0:
+                if not self.__cond.wait(timeout=report_interval):
+                    logger.info(f'pipeline: {self.format_stats()}')
+        for executor in self.__executors:
+            executor.shutdown()
+        return time.monotonic() - self.started
 
-    papi = PAPIClient(**cfg_papi)
 
-    dir_jobs = os.environ.get('NVFL_JOBS_DIR', os.path.join(os.path.curdir, 'jobs'))
-    os.makedirs(dir_jobs, exist_ok=True)
+def parse_stage_parallel(value: str | None) -> dict:
+    stage_parallel = {}
+    for kv in (value or '').split(','):
+        if not kv.strip():
+            continue
+        stage, workers = kv.split('=')
+        stage_parallel[stage.strip()] = int(workers)
+    return stage_parallel
+
+
+def do_scenario_pipeline(
+        project_admin: NVFLDashboardClient,
+        plan: ScenarioPlan,
+        directory: DashboardDirectory,
+        working_dir: str = os.path.curdir,
+        init: bool = True,
+        download: bool = True,
+        start: bool = True,
+        reconcile: bool = False,
+        parallel: int = 1,
+        stage_parallel: dict = {},
+        client_name_prefix: str = '',
+        download_dir: str = 'downloads',
+        extract_dir: str = os.path.curdir,
+        data_dir: str = 'data',
+        force_download: bool = False,
+        admit_timeout: float = 0
+):
+    pin = '1234'
+    download_dir = os.path.normpath(os.path.join(working_dir, download_dir))
+    extract_dir = os.path.normpath(os.path.join(working_dir, extract_dir))
+    os.makedirs(download_dir, exist_ok=True)
+    os.makedirs(extract_dir, exist_ok=True)
+    cache = DownloadCache(download_dir) if download else None
+    scheduler = get_placement_scheduler(plan, client_name_prefix) if start else None
+    # one snapshot of the containers of the job, taken before any client is launched
+    containers = get_containers(client_name_prefix.strip()) if start else {}
+    if scheduler:
+        scheduler.sync(containers)
+    launched = {
+        'started': [],
+        'already_running': [],
+        'queued': [],
+        'failed': []
+    }
+    launched_clients = {}
+    launched_lock = threading.Lock()
+
+    def stage_org(item):
+        org = item['org']
+        users_cfg = plan.get_users(org)
+        org_admin_cfg = plan.get_org_admin(org)
+        if not init:
+            org_admin = NVFLDashboardClient(project_admin.get_base_url(), org_admin_cfg['email'], org_admin_cfg['password']) if download else None
+            return [{'name': client['name'], 'org': org, 'org_admin': org_admin, 'client': client} for client in directory.get_clients(org=org)]
+        if reconcile:
+            delta = plan_organization(org, plan, directory)
+            directory.approve_users(delta['approve_users'] + project_admin.create_users(delta['create_users']))
+            existing = {client['name']: client for client in delta['clients'] + delta['approve_clients']}
+        else:
+            directory.approve_users(project_admin.create_users(users_cfg))
+            existing = {}
+        org_admin = NVFLDashboardClient(project_admin.get_base_url(), org_admin_cfg['email'], org_admin_cfg['password'])
+        return [
+            {'name': client_cfg['name'], 'org': org, 'org_admin': org_admin, 'client_cfg': client_cfg, 'client': existing.get(client_cfg['name'])}
+            for client_cfg in plan.get_clients(org)
+        ]
+
+    def stage_create(item):
+        if not item['client']:
+            item['client'] = item['org_admin'].create_one_client(**item['client_cfg'])
+            logger.info('client %s added in NVFLARE Dashboard' % item['name'])
+        return [item]
+
+    def stage_approve(item):
+        # clients approved at the same time share the verification listing of the directory
+        item['client'] = directory.approve_clients([item['client']])[0]
+        return [item]
+
+    def stage_download(item):
+        if item.get('console'):
+            item['key'] = get_console_cache_key(project_admin.get_username())
+            item['zip'] = cache.fetch(item['key'], project_admin.user, lambda: project_admin.download_flare_console(pin=pin, dir=download_dir), force_download)
+        else:
+            item['key'] = get_client_cache_key(item['client'])
+            item['zip'] = cache.fetch(item['key'], item['client'], lambda: item['org_admin'].download_client_startup_kit(item['client']['id'], dir=download_dir), force_download)
+        logger.info(f'startup kit of {item["name"]}: {item["zip"]}')
+        return [item]
+
+    def stage_extract(item):
+        extracted = cache.extract(item['key'], item['zip'], extract_dir if item.get('console') else os.path.join(extract_dir, item['org']), pin)
+        logger.info(f'extracted {item["name"]}' if extracted else f'{item["name"]} already extracted')
+        return [item]
+
+    def stage_launch(item):
+        name = get_container_name(item['client'], client_name_prefix)
+        container = containers.get(name)
+        entry = {'client': item['name'], 'container': name, 'state': None, 'exit_code': None, 'placement': None}
+        if container and container['state'] == 'running':
+            logger.info(f'client {item["name"]} is already running')
+            with launched_lock:
+                launched['already_running'].append(dict(entry, state=container['state']))
+            return [item]
+        if scheduler and not scheduler.fits_host(item['client']):
+            with launched_lock:
+                launched['failed'].append(entry)
+            raise Exception('the client requests more resources than the host has')
+        try:
+            entry['placement'], p = launch_one(item['client'], working_dir, extract_dir, data_dir, client_name_prefix=client_name_prefix,
+                                               scheduler=scheduler, admit_timeout=admit_timeout, stale=container is not None)
+        except BaseException:
+            with launched_lock:
+                launched['failed'].append(entry)
+            raise
+        if p is None:
+            logger.warning(f'client {item["name"]} queued, the host is full')
+            with launched_lock:
+                launched['queued'].append(entry)
+            return []
+        entry['exit_code'] = p.returncode
+        # the state is checked for all launched clients at once when the pipeline is done
+        with launched_lock:
+            launched['started' if p.returncode == 0 else 'failed'].append(entry)
+            launched_clients[item['name']] = item['client']
+        if p.returncode != 0:
+            raise Exception(f'docker.sh exited with code {p.returncode}')
+        return [item]
+
+    stages = [('org', stage_org)]
+    if init:
+        stages += [('create', stage_create), ('approve', stage_approve)]
+    if download:
+        stages += [('download', stage_download), ('extract', stage_extract)]
+    if start:
+        stages += [('launch', stage_launch)]
+    last_name, last_func = stages[-1]
+
+    def stage_last(item):
+        # the console is extracted but not launched, and only clients count as completed
+        if item.get('console'):
+            if last_name != 'launch':
+                last_func(item)
+            return []
+        return last_func(item)
+
+    stages[-1] = (last_name, stage_last)
+    # approve workers only wait for the shared batch of the directory, whose PATCHes approve_many bounds;
+    # more of them make larger batches, verified by fewer listings
+    defaults = {'approve': max(parallel, 32)}
+    pipeline = Pipeline([(name, func, stage_parallel.get(name, defaults.get(name, parallel))) for name, func in stages])
+    for org in plan.organizations:
+        pipeline.submit({'name': org, 'org': org})
+    if download:
+        pipeline.submit({'name': 'flare console', 'console': True}, stage=[name for name, _ in stages].index('download'))
+    elapsed = pipeline.join()
+    if init:
+        directory.invalidate()
+    if cache:
+        cache.save()
+        logger.info(f'startup kits: {cache.format_stats()}')
+    if scheduler:
+        placements = [placement for placement in scheduler.placements.values() if placement['wave'] > 0]
+        logger.info('placed %d clients: %.1f of %.1f CPUs, %.1f of %.1f GiB' % (
+            len(placements), sum(p['cpus'] for p in placements), scheduler.host['cpus'],
+            sum(p['memory'] for p in placements) / GiB, scheduler.host['memory'] / GiB))
+    logger.info(f'pipeline: {pipeline.format_stats()}')
+    clients = pipeline.completed
+    if pipeline.first_completed is not None:
+        logger.info('pipeline finished in %.1fs, first of %d clients done after %.1fs' % (elapsed, len(clients), pipeline.first_completed))
+    if start:
+        # launched containers that exited right away are failed, as with --start without --pipeline
+        running = check_clients_running(list(launched_clients.values()), client_name_prefix) if launched_clients else {}
+        for entry in launched['started'] + launched['failed']:
+            entry['state'] = (running.get(entry['client']) or {}).get('state')
+        not_running = [entry for entry in launched['started'] if entry['state'] != 'running']
+        launched['started'] = [entry for entry in launched['started'] if entry['state'] == 'running']
+        launched['failed'] += not_running
+        print_launch_summary(launched)
+        if launched['queued']:
+            logger.warning('%d clients queued, the host is full; run --start again when resources are free, or use --admit-timeout' % len(launched['queued']))
+        if not_running:
+            logger.error('clients not running: %s' % ', '.join(entry['client'] for entry in not_running))
+    if pipeline.failed:
+        raise Exception('pipeline failed for: %s' % ', '.join(f'{item.get("name")} ({name})' for name, item, _ in pipeline.failed))
+    if start and launched['failed']:
+        raise Exception('could not start clients: %s' % ', '.join(entry['client'] for entry in launched['failed']))
+    return clients
+
+
+def get_jobs_dir() -> str:
+    return os.environ.get('NVFL_JOBS_DIR', os.path.join(os.path.curdir, 'jobs'))
+
+def get_job_dir(job_ID: str) -> str:
+    return os.path.join(get_jobs_dir(), job_ID)
+
+def get_token_cache_file(args, job_ID: str, name: str = '.papi-token.json') -> str | None:
+    if not args.cache_token:
+        return None
+    return os.path.join(get_job_dir(job_ID), name)
+
+
+def get_required_job_ID(args, run_info: dict) -> str:
+    job_ID = args.jobid
+    logger.debug(f'job_ID: {job_ID}')
+    if not job_ID:
+        print('--jobid argument or NVFL_JOBID env var is required', file=sys.stderr, flush=True)
+        sys.exit(1)
+    run_info['job_ID'] = job_ID
+    return job_ID
 
-    def get_job_dir(job_ID):
-        return os.path.join(dir_jobs, job_ID)
 
-    if args.subcommand == 'job':
-        if args.start:
+def cmd_job(args, papi: PAPIClient, cfg_job: dict, run_info: dict):
+    if args.delete:
+        job_ID = get_required_job_ID(args, run_info)
+        papi.token_cache.set_file(get_token_cache_file(args, job_ID))
+        # the clients are stopped first, they would keep reconnecting to the deleted FL server
+        do_teardown(job_ID, parallel=args.parallel, purge=args.purge)
+        with get_metrics().span('phase.delete'):
+            papi.delete_tool_nvflare(job_ID)
+        logger.info(f'job {job_ID} deleted')
+    if args.start:
+        with get_metrics().span('phase.deploy'):
             job_ID = papi.deploy_tool_nvflare(**cfg_job)
-            logger.debug(f'job_ID: {job_ID}')
-            print(job_ID, file=sys.stdout, flush=True)
-            os.makedirs(get_job_dir(job_ID))
-            nvfl_dashboard_endpoint = urljoin(papi.get_job_endpoints(job_ID)['dashboard'], str(args.nvflare_dashboard_namespace).lstrip('/'))
-            logging.info(f'NVFLARE Dashboard: {nvfl_dashboard_endpoint}')
- 
-    if args.subcommand == 'scenario':
-        logger.debug(f'args.jobid: {args.jobid}')
-        logger.debug('os.getenv(\'NVFL_JOBID\'): %s', os.getenv('NVFL_JOBID'))
-        job_ID = args.jobid
         logger.debug(f'job_ID: {job_ID}')
-        if not job_ID:
-            print('--jobid argument or NVFL_JOBID env var is required', file=sys.stderr, flush=True)
-            sys.exit(1)
-        nvfl_dashboard_endpoint = urljoin(papi.get_job_endpoints(job_ID)['dashboard'], str(args.nvflare_dashboard_namespace).lstrip('/'))
+        print(job_ID, file=sys.stdout, flush=True)
+        os.makedirs(get_job_dir(job_ID))
+        run_info['job_ID'] = job_ID
+        papi.token_cache.set_file(get_token_cache_file(args, job_ID))
+        job_endpoints = papi.get_job_endpoints(job_ID)
+        nvfl_dashboard_endpoint = urljoin(job_endpoints['dashboard'], str(args.nvflare_dashboard_namespace).lstrip('/'))
         logging.info(f'NVFLARE Dashboard: {nvfl_dashboard_endpoint}')
-        nvfl_server_jupyter_endpoint = papi.get_job_endpoints(job_ID)['server-jupyter']
-        logging.info(f'NVFLARE FL Server JupyterLab: {nvfl_server_jupyter_endpoint}')
+        if args.wait:
+            with get_metrics().span('phase.wait'):
+                ready = wait_for_endpoints(
+                    get_job_readiness_probes(nvfl_dashboard_endpoint, job_endpoints.get('server-jupyter')),
+                    deadline=args.wait_timeout
+                )
+            logger.debug(f'time to ready: {ready}')
+
+
+def cmd_scenario(args, papi: PAPIClient, cfg_job: dict, run_info: dict):
+    logger.debug(f'args.jobid: {args.jobid}')
+    logger.debug('os.getenv(\'NVFL_JOBID\'): %s', os.getenv('NVFL_JOBID'))
+    job_ID = get_required_job_ID(args, run_info)
+    # the scenario is validated before any API call
+    plan = load_scenario_plan(args.cfg, get_job_dir(job_ID), {'{jobid}': job_ID})
+    papi.token_cache.set_file(get_token_cache_file(args, job_ID))
+    get_dashboard_login_cache().set_file(get_token_cache_file(args, job_ID, '.dashboard-tokens.json'))
+    if args.stop or args.purge:
+        do_teardown(job_ID, parallel=args.parallel, purge=args.purge)
+    if args.init or args.download or args.start or not (args.watch or args.stop or args.purge):
+        job_endpoints = papi.get_job_endpoints(job_ID)
+        do_scenario(args, plan, job_ID, job_endpoints, cfg_job)
+    if args.watch:
+        with get_metrics().span('phase.watch'):
+            do_watch_clients(
+                plan,
+                get_job_dir(job_ID),
+                client_name_prefix=job_ID,
+                parallel=args.parallel,
+                interval=args.watch_interval,
+                max_backoff=args.watch_max_backoff,
+                flap_limit=args.watch_flap_limit,
+                duration=args.watch_duration
+            )
+
+
+def do_scenario(args, plan: ScenarioPlan, job_ID: str, job_endpoints: dict, cfg_job: dict):
+    nvfl_dashboard_endpoint = urljoin(job_endpoints['dashboard'], str(args.nvflare_dashboard_namespace).lstrip('/'))
+    logging.info(f'NVFLARE Dashboard: {nvfl_dashboard_endpoint}')
+    nvfl_server_jupyter_endpoint = job_endpoints['server-jupyter']
+    logging.info(f'NVFLARE FL Server JupyterLab: {nvfl_server_jupyter_endpoint}')
+    with get_metrics().span('phase.wait'):
         nvfl_project_admin = init_nvfl_dashboard_client(
             endpoint=nvfl_dashboard_endpoint,
             username=cfg_job['dashboard']['username'],
-            password=cfg_job['dashboard']['password']
+            password=cfg_job['dashboard']['password'],
+            probes=get_job_readiness_probes(nvfl_dashboard_endpoint, nvfl_server_jupyter_endpoint, plan.ready),
+            deadline=args.wait_timeout
         )
-        cfg_scenario = load_config(file=args.cfg)
-        if args.init:
-            orgs = do_scenario_init(nvfl_project_admin, cfg_scenario)
-            logger.debug('scenario:\n%s' % json.dumps(orgs, indent=2))
-        if args.download:
-            do_download_nvflare_scripts(nvfl_project_admin, cfg_scenario, working_dir=get_job_dir(job_ID), extract=True)
-        if args.start:
-            do_start_clients(cfg_scenario, nvfl_dashboard_endpoint, working_dir=get_job_dir(job_ID), client_name_prefix=job_ID)
+    directory = get_dashboard_directory(nvfl_project_admin)
+    if args.pipeline:
+        with get_metrics().span('phase.pipeline'):
+            do_scenario_pipeline(
+                nvfl_project_admin,
+                plan,
+                directory,
+                working_dir=get_job_dir(job_ID),
+                init=args.init,
+                download=args.download,
+                start=args.start,
+                reconcile=args.reconcile,
+                parallel=args.parallel,
+                stage_parallel=parse_stage_parallel(args.stage_parallel),
+                client_name_prefix=job_ID,
+                force_download=args.force_download,
+                admit_timeout=args.admit_timeout
+            )
+        return
+    if args.init:
+        with get_metrics().span('phase.init'):
+            orgs = do_scenario_init(nvfl_project_admin, plan, parallel=args.parallel, reconcile=args.reconcile, directory=directory)
+        logger.debug('scenario:\n%s' % json.dumps(orgs, indent=2))
+    if args.download:
+        with get_metrics().span('phase.download'):
+            do_download_nvflare_scripts(nvfl_project_admin, plan, working_dir=get_job_dir(job_ID), extract=True, parallel=args.parallel, directory=directory, force_download=args.force_download)
+    if args.start:
+        with get_metrics().span('phase.start'):
+            do_start_clients(plan, directory, working_dir=get_job_dir(job_ID), client_name_prefix=job_ID, parallel=args.parallel, admit_timeout=args.admit_timeout)
+
+
+def load_fleet_config(file: str, cfg_job_default: str) -> list:
+    cfg_fleet = load_config(file=file)
+    # paths in the fleet config are relative to the fleet config itself
+    base_dir = os.path.dirname(os.path.abspath(file))
+    jobs = []
+    names = set()
+    for i, job_cfg in enumerate(cfg_fleet.get('jobs', [])):
+        name = job_cfg.get('name', f'job-{i + 1}')
+        if name in names:
+            raise Exception(f'duplicate job name {name} in fleet config {file}')
+        names.add(name)
+        jobs.append({
+            'name': name,
+            'cfg_job': os.path.join(base_dir, job_cfg['job']) if job_cfg.get('job') else cfg_job_default,
+            'cfg': os.path.join(base_dir, job_cfg['scenario']) if job_cfg.get('scenario') else None
+        })
+    if not jobs:
+        raise Exception(f'no jobs in fleet config {file}')
+    return jobs
+
+
+class FleetIndex:
+
+    def __init__(self, file: str):
+        self.file = file
+        self.jobs = {}
+        self.__lock = threading.Lock()
+
+    def update(self, name: str, **kwargs):
+        # the index is rewritten on every change, so the IDs of deployed jobs survive a failed run
+        with self.__lock:
+            self.jobs.setdefault(name, {'name': name}).update(kwargs)
+            content = json.dumps({'updated': time.time(), 'jobs': list(self.jobs.values())}, indent=2)
+            write_file_atomic(self.file, content)
+
+
+def do_fleet_job(args, papi: PAPIClient, job: dict, index: FleetIndex):
+    name = job['name']
+    cfg_job = load_config(file=job['cfg_job'])
+    with get_metrics().span('phase.deploy'):
+        job_ID = papi.deploy_tool_nvflare(**cfg_job)
+    os.makedirs(get_job_dir(job_ID), exist_ok=True)
+    job_endpoints = papi.get_job_endpoints(job_ID)
+    nvfl_dashboard_endpoint = urljoin(job_endpoints['dashboard'], str(args.nvflare_dashboard_namespace).lstrip('/'))
+    logger.info(f'{name}: deployed job {job_ID}')
+    index.update(name, job_ID=job_ID, job_dir=get_job_dir(job_ID), endpoints=job_endpoints, nvflare_dashboard=nvfl_dashboard_endpoint, status='deployed')
+    if job['cfg'] and (args.init or args.download or args.start):
+        plan = load_scenario_plan(job['cfg'], get_job_dir(job_ID), {'{jobid}': job_ID})
+        do_scenario(args, plan, job_ID, job_endpoints, cfg_job)
+        index.update(name, status='provisioned')
+    elif args.wait:
+        with get_metrics().span('phase.wait'):
+            wait_for_endpoints(
+                get_job_readiness_probes(nvfl_dashboard_endpoint, job_endpoints.get('server-jupyter')),
+                deadline=args.wait_timeout
+            )
+        index.update(name, status='ready')
+    return job_ID
 
 
+def cmd_fleet(args, papi: PAPIClient, run_info: dict):
+    jobs = load_fleet_config(args.cfg, args.cfg_job)
+    # every scenario is validated before the first deployment
+    for job in jobs:
+        if job['cfg']:
+            load_scenario_plan(job['cfg'])
+    if args.cache_token:
+        papi.token_cache.set_file(os.path.join(get_jobs_dir(), '.papi-token.json'))
+        get_dashboard_login_cache().set_file(os.path.join(get_jobs_dir(), '.dashboard-tokens.json'))
+    index = FleetIndex(args.index or os.path.join(get_jobs_dir(), 'fleet.json'))
+    run_info['fleet_index'] = index.file
+    for job in jobs:
+        index.update(job['name'], cfg_job=job['cfg_job'], cfg=job['cfg'], status='pending')
+    failed = []
+    # the jobs share the PAPI client, its access token and the connection pool
+    with ThreadPoolExecutor(max_workers=max(args.fleet_parallel or len(jobs), 1), thread_name_prefix='fleet') as executor:
+        futures = {executor.submit(do_fleet_job, args, papi, job, index): job['name'] for job in jobs}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                job_ID = future.result()
+            except Exception as e:
+                logger.error(f'{name}: {e!r}')
+                index.update(name, status='failed', error=repr(e))
+                failed.append(name)
+                continue
+            print(f'{name} {job_ID}', file=sys.stdout, flush=True)
+    logger.info(f'fleet index written to {index.file}')
+    if failed:
+        raise Exception(f'fleet failed for jobs: {", ".join(failed)}')
+
+
+def read_json_file(file: str, errors: list) -> dict | None:
+    try:
+        return load_config(file=file)
+    except FileNotFoundError:
+        errors.append(f'missing {os.path.basename(file)}')
+    except ValueError as e:
+        errors.append(f'invalid JSON in {os.path.basename(file)}: {e}')
+    return None
 
 
-if __name__ == "__main__":
+def validate_fl_app(app_dir: str, plan: ScenarioPlan | None = None) -> dict:
+    # checks what the FL server would reject only after the job is submitted; all problems are reported at once
+    errors = []
+    meta = read_json_file(os.path.join(app_dir, 'meta.json'), errors)
+    if meta is not None:
+        deploy_map = meta.get('deploy_map')
+        if not isinstance(deploy_map, dict) or not deploy_map:
+            errors.append('meta.json has no deploy_map')
+            deploy_map = {}
+        clients = {client['name'] for client in plan.clients} if plan else None
+        for app, sites in deploy_map.items():
+            if not isinstance(sites, list) or not sites:
+                errors.append(f'app {app} is not deployed to any site')
+                continue
+            config_dir = os.path.join(app_dir, app, 'config')
+            if not os.path.isdir(config_dir):
+                errors.append(f'app {app} has no config directory')
+                continue
+            if 'server' in sites or '@ALL' in sites:
+                read_json_file(os.path.join(config_dir, 'config_fed_server.json'), errors)
+            if any(site != 'server' for site in sites):
+                read_json_file(os.path.join(config_dir, 'config_fed_client.json'), errors)
+            if clients is not None:
+                unknown = [site for site in sites if site not in ['server', '@ALL'] and site not in clients]
+                if unknown:
+                    errors.append(f'app {app} is deployed to sites not in the scenario: {", ".join(unknown)}')
+        min_clients = meta.get('min_clients', 0)
+        if not isinstance(min_clients, int) or min_clients < 0:
+            errors.append(f'invalid min_clients: {min_clients!r}')
+        elif clients is not None and min_clients > len(clients):
+            errors.append(f'min_clients is {min_clients}, the scenario has {len(clients)} clients')
+    if errors:
+        raise Exception(f'invalid FL app {app_dir}:\n' + '\n'.join(f'  - {error}' for error in errors))
+    return meta
+
+
+def get_fl_app_hash(app_dir: str) -> str:
+    # paths and contents of all files of the app, in a stable order
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(app_dir):
+        dirs[:] = sorted(dir for dir in dirs if not dir.startswith('.') and dir != '__pycache__')
+        for name in sorted(files):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(root, name)
+            h.update(os.path.relpath(path, app_dir).encode('utf-8') + b'\0')
+            with open(path, mode='rb') as f:
+                h.update(b'%d\0' % os.fstat(f.fileno()).st_size)
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(chunk)
+    return h.hexdigest()
+
+
+class AppBundleCache:
+
+    def __init__(self, dir: str):
+        # each app is copied once per content hash to `<sha256>/<app name>/`; the jobs are submitted from the copy,
+        # so editing fl_apps/ during a sweep does not change the jobs not yet submitted
+        self.dir = dir
+        self.stats = {'packaged': 0, 'cached': 0}
+        os.makedirs(dir, exist_ok=True)
+
+    def package(self, app_dir: str) -> dict:
+        name = os.path.basename(os.path.normpath(app_dir))
+        sha256 = get_fl_app_hash(app_dir)
+        bundle_dir = os.path.join(self.dir, sha256, name)
+        if os.path.isdir(bundle_dir):
+            self.stats['cached'] += 1
+            return {'name': name, 'sha256': sha256, 'dir': bundle_dir}
+        with get_metrics().span('submit.package'):
+            tmp_dir = tempfile.mkdtemp(dir=self.dir, prefix='.')
+            try:
+                shutil.copytree(app_dir, os.path.join(tmp_dir, name), ignore=shutil.ignore_patterns('.*', '__pycache__'))
+                os.makedirs(os.path.dirname(bundle_dir), exist_ok=True)
+                os.rename(os.path.join(tmp_dir, name), bundle_dir)
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.stats['packaged'] += 1
+        return {'name': name, 'sha256': sha256, 'dir': bundle_dir}
+
+    def format_stats(self) -> str:
+        return '%d apps packaged, %d unchanged' % (self.stats['packaged'], self.stats['cached'])
+
+
+def get_fl_app_dirs(apps: list, apps_dir: str) -> list:
+    # apps are given by their path or their name in apps_dir; by default, all apps in apps_dir
+    if not apps:
+        if not os.path.isdir(apps_dir):
+            raise Exception(f'FL apps directory {os.path.abspath(apps_dir)} not found, give the apps or their directory with --apps-dir')
+        apps = sorted(name for name in os.listdir(apps_dir) if os.path.isfile(os.path.join(apps_dir, name, 'meta.json')))
+        if not apps:
+            raise Exception(f'no FL apps in {apps_dir}')
+    return [app if os.path.isdir(app) else os.path.join(apps_dir, app) for app in apps]
+
+
+def get_console_dir(job_dir: str, username: str) -> str:
+    download_dir = os.path.join(job_dir, 'downloads')
+    dirs = DownloadCache(download_dir).extracted_dirs(get_console_cache_key(username)) if os.path.isdir(download_dir) else []
+    for dir in dirs:
+        if os.path.isfile(os.path.join(dir, 'startup', 'fed_admin.json')):
+            return dir
+    raise Exception(f'the FLARE console of {username} is not extracted in {job_dir}, run `scenario --download` first')
+
+
+def new_flare_session(username: str, console_dir: str, timeout: float = 10):
+    # the FLARE admin API comes with nvflare, which is needed by the submit subcommand only
+    try:
+        from nvflare.fuel.flare_api.flare_api import new_secure_session
+    except ImportError:
+        raise Exception('the submit subcommand needs the nvflare package, `pip install nvflare` in the version of the FL server')
+    with get_metrics().span('flare.login'):
+        return new_secure_session(username=username, startup_kit_location=console_dir, timeout=timeout)
+
+
+class SubmissionIndex:
+
+    def __init__(self, file: str):
+        # submitted FLARE jobs of all runs, with their app, bundle and last known status
+        self.file = file
+        self.jobs = {}
+        try:
+            with open(file, mode='r') as f:
+                self.jobs = {job['job_id']: job for job in json.load(f).get('jobs', [])}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f'ignoring unreadable submission index {file}: {e!r}')
+
+    def update(self, job_ID: str, **kwargs):
+        self.jobs.setdefault(job_ID, {'job_id': job_ID}).update(kwargs, updated=time.time())
+        write_file_atomic(self.file, json.dumps({'jobs': list(self.jobs.values())}, indent=2))
+
+
+def is_flare_job_finished(status: str | None) -> bool:
+    return bool(status) and status.startswith('FINISHED')
+
+
+def poll_flare_jobs(session, jobs: list, index: SubmissionIndex, interval: float = 5, max_interval: float = 60, timeout: float | None = None):
+    # the interval doubles up to max_interval while no job changes its status, and starts over when one does
+    deadline = time.monotonic() + timeout if timeout else None
+    delay = interval
+    pending = [job for job in jobs if not is_flare_job_finished(job['status'])]
+    while pending:
+        time.sleep(delay)
+        changed = False
+        with get_metrics().span('flare.poll'):
+            for job in pending:
+                try:
+                    status = session.get_job_meta(job['job_id']).get('status')
+                except Exception as e:
+                    logger.warning(f'getting the status of FLARE job {job["job_id"]} failed: {e!r}')
+                    continue
+                if status != job['status']:
+                    logger.info(f'{job["app"]} {job["job_id"]}: {status}')
+                    job['status'] = status
+                    index.update(job['job_id'], status=status)
+                    changed = True
+        pending = [job for job in pending if not is_flare_job_finished(job['status'])]
+        delay = interval if changed else min(delay * 2, max_interval)
+        if pending and deadline and time.monotonic() + delay > deadline:
+            logger.warning(f'stopped waiting for {len(pending)} FLARE jobs, their status is in {index.file}')
+            break
+
+
+def print_submit_summary(jobs: list, file=sys.stdout):
+    rows = [('APP', 'BUNDLE', 'JOB ID', 'STATUS')]
+    for job in jobs:
+        rows.append((job['app'], job['bundle'][:12], job['job_id'] or '-', job['status'] or '-'))
+    print_table(rows, file=file)
+
+
+def cmd_submit(args, cfg_job: dict, run_info: dict):
+    job_ID = get_required_job_ID(args, run_info)
+    job_dir = get_job_dir(job_ID)
+    # with the scenario, the sites and min_clients of the apps are checked against its clients
+    plan = load_scenario_plan(args.cfg, job_dir, {'{jobid}': job_ID}) if os.path.isfile(args.cfg) else None
+    app_dirs = get_fl_app_dirs(args.apps, args.apps_dir)
+    errors = []
+    for app_dir in app_dirs:
+        try:
+            validate_fl_app(app_dir, plan)
+        except Exception as e:
+            errors.append(str(e))
+    if errors:
+        raise Exception('\n'.join(errors))
+    cache = AppBundleCache(os.path.join(get_jobs_dir(), '.fl-apps'))
+    bundles = [cache.package(app_dir) for app_dir in app_dirs]
+    logger.info(cache.format_stats())
+    username = cfg_job['dashboard']['username']
+    session = new_flare_session(username, get_console_dir(job_dir, username), timeout=args.flare_timeout)
+    index = SubmissionIndex(os.path.join(job_dir, 'submissions.json'))
+    run_info['submission_index'] = index.file
+    jobs = []
+    try:
+        for bundle in bundles:
+            for _ in range(args.repeat):
+                job = {'app': bundle['name'], 'bundle': bundle['sha256'], 'job_id': None, 'status': None}
+                try:
+                    with get_metrics().span('flare.submit'):
+                        job['job_id'] = session.submit_job(bundle['dir'])
+                except Exception as e:
+                    logger.error(f'submitting {bundle["name"]} failed: {e!r}')
+                    jobs.append(job)
+                    continue
+                job['status'] = 'SUBMITTED'
+                index.update(job['job_id'], app=job['app'], bundle=job['bundle'], status=job['status'], submitted=time.time())
+                jobs.append(job)
+                print(f'{job["app"]} {job["job_id"]}', file=sys.stdout, flush=True)
+        if args.wait:
+            poll_flare_jobs(
+                session,
+                [job for job in jobs if job['job_id']],
+                index,
+                interval=args.poll_interval,
+                max_interval=args.poll_max_interval,
+                timeout=args.wait_timeout
+            )
+    finally:
+        session.close()
+    if args.wait:
+        print_submit_summary(jobs)
+    failed = [job for job in jobs if not job['job_id'] or (args.wait and job['status'] != 'FINISHED:COMPLETED')]
+    if failed:
+        raise Exception('FL jobs not submitted or not completed: %s' % ', '.join(f'{job["app"]} ({job["job_id"] or "not submitted"})' for job in failed))
+
+
+def write_run_reports(dir: str, metrics: Metrics, profiler: cProfile.Profile | None = None, run_info: dict = {}):
+    os.makedirs(dir, exist_ok=True)
+    metrics.write_json(os.path.join(dir, 'metrics.json'), run_info=run_info)
+    metrics.write_prometheus(os.path.join(dir, 'metrics.prom'), run_info=run_info)
+    logger.info(f'metrics written to {os.path.join(dir, "metrics.json")} and {os.path.join(dir, "metrics.prom")}')
+    if profiler:
+        profile_file = os.path.join(dir, 'profile.pstats')
+        profiler.dump_stats(profile_file)
+        logger.info(f'profile written to {profile_file}')
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats('cumulative').print_stats(25)
+
+
+def run(args, papi: PAPIClient, cfg_job: dict | None):
+    metrics = get_metrics()
+    http_session = get_http_session()
+    http_stats_before = http_session.stats()
+
+    dir_jobs = get_jobs_dir()
+    os.makedirs(dir_jobs, exist_ok=True)
 
+    run_info = {'subcommand': args.subcommand, 'argv': getattr(args, 'argv', sys.argv[1:])}
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    try:
+        with metrics.span('run'):
+            if args.subcommand == 'job':
+                cmd_job(args, papi, cfg_job, run_info)
+            if args.subcommand == 'scenario':
+                cmd_scenario(args, papi, cfg_job, run_info)
+            if args.subcommand == 'fleet':
+                cmd_fleet(args, papi, run_info)
+            if args.subcommand == 'submit':
+                cmd_submit(args, cfg_job, run_info)
+    finally:
+        if profiler:
+            profiler.disable()
+        # the session outlives a single run in serve mode, only this run is reported
+        http_stats = {k: v - http_stats_before[k] for k, v in http_session.stats().items()}
+        logger.info('http connections: %d new, %d reused (%d requests)' % (http_stats['connections_new'], http_stats['connections_reused'], http_stats['requests']))
+        run_info['http_connections'] = http_stats
+        limiter_stats = http_session.limiter_stats()
+        for host, stats in limiter_stats['hosts'].items():
+            logger.info('http concurrency %s: limit %d, peak %d in flight, %d overloaded responses, %d requests throttled' % (
+                host, stats['limit'], stats['peak_in_flight'], stats['overloads'], stats['throttled']))
+        run_info['http_concurrency'] = limiter_stats
+        if 'job_ID' in run_info and os.path.isdir(get_job_dir(run_info['job_ID'])):
+            write_run_reports(get_job_dir(run_info['job_ID']), metrics, profiler, run_info)
+        elif profiler or args.subcommand == 'fleet':
+            write_run_reports(dir_jobs, metrics, profiler, run_info)
+
+
+# environment variables of the client applied to the commands run by the server
+SERVE_ENV = ['NVFL_JOBS_DIR', 'NVFL_JOBID', 'NVFLARE_DASHBOARD_NAMESPACE']
+
+def get_socket_file() -> str:
+    return os.getenv('NVFL_SOCKET', os.path.join(get_jobs_dir(), '.tool-nvflare.sock'))
+
+
+class ServeOutput:
+
+    def __init__(self, wfile):
+        # file-like object; whatever a command prints or logs is sent to the client as JSON lines
+        self.wfile = wfile
+        self.__lock = threading.Lock()
+
+    def send(self, msg: dict):
+        with self.__lock:
+            try:
+                self.wfile.write((json.dumps(msg) + '\n').encode('utf-8'))
+                self.wfile.flush()
+            except OSError:
+                # the client went away; the command runs to its end anyway
+                pass
+
+    def write(self, data: str) -> int:
+        if data:
+            self.send({'out': data})
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class ServeHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        out = ServeOutput(self.wfile)
+        out.send({'exit': self.server.execute(request, out)})
+
+
+class ToolServer(socketserver.UnixStreamServer):
+
+    def __init__(self, socket_file: str, log_level: str = 'INFO'):
+        self.log_level = log_level
+        self.__papi_clients = {}
+        super().__init__(socket_file, ServeHandler)
+
+    def get_papi(self, file: str) -> PAPIClient:
+        # PAPI clients, with their access tokens and job endpoints, live as long as their config does not change
+        file = os.path.abspath(file)
+        key = (file, os.path.getmtime(file))
+        if key not in self.__papi_clients:
+            self.__papi_clients = {k: v for k, v in self.__papi_clients.items() if k[0] != file}
+            self.__papi_clients[key] = PAPIClient(**load_config(file=file))
+        return self.__papi_clients[key]
+
+    def execute(self, request: dict, out: ServeOutput) -> int:
+        if request.get('shutdown'):
+            logger.info('shutdown requested')
+            threading.Thread(target=self.shutdown).start()
+            return 0
+        # commands are served one at a time, so the working directory, environment and
+        # output redirection of the process can be switched to those of the client
+        cwd = os.getcwd()
+        environ = dict(os.environ)
+        handler = logging.StreamHandler(out)
+        handler.setFormatter(logging.root.handlers[0].formatter if logging.root.handlers else None)
+        logging.root.addHandler(handler)
+        started = time.monotonic()
+        try:
+            os.chdir(request.get('cwd', cwd))
+            for name in SERVE_ENV:
+                if name in request.get('env', {}):
+                    os.environ[name] = request['env'][name]
+                else:
+                    os.environ.pop(name, None)
+            with redirect_stdout(out), redirect_stderr(out):
+                try:
+                    args = get_parser().parse_args(request.get('argv', []))
+                    if args.subcommand == 'serve':
+                        print('already serving', file=sys.stderr)
+                        return 2
+                    if getattr(args, 'watch', False):
+                        # a watch never ends and would block all the other commands
+                        print('--watch is not served, run it with tool_nvflare.py directly', file=sys.stderr)
+                        return 2
+                    args.argv = request.get('argv', [])
+                    logger.setLevel(args.log_level)
+                    reset_metrics()
+                    cfg_job = load_config(file=args.cfg_job) if args.subcommand != 'fleet' else None
+                    run(args, self.get_papi(args.cfg_papi), cfg_job)
+                    return 0
+                except SystemExit as e:
+                    return e.code if isinstance(e.code, int) else int(e.code is not None)
+                except Exception as e:
+                    logger.exception(f'command failed: {e!r}')
+                    return 1
+        finally:
+            logging.root.removeHandler(handler)
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(environ)
+            logger.setLevel(self.log_level)
+            logger.info('served %s in %.3fs' % (shlex.join(request.get('argv', [])), time.monotonic() - started))
+
+
+def serve(args):
+    socket_file = os.path.abspath(args.socket or get_socket_file())
+    if os.path.exists(socket_file):
+        # a socket left behind by a server that did not stop cleanly can be removed
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(socket_file)
+            except ConnectionRefusedError:
+                os.remove(socket_file)
+            else:
+                raise Exception(f'a server is already listening on {socket_file}')
+    os.makedirs(os.path.dirname(socket_file), exist_ok=True)
+    configure_dashboard_directories(max_age=args.directory_max_age)
+    umask = os.umask(0o077)
+    try:
+        server = ToolServer(socket_file, log_level=args.log_level)
+    finally:
+        os.umask(umask)
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    logger.info(f'serving on {socket_file}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_file)
+        logger.info('server stopped')
+
+
+def main(args):
+    logger.setLevel(args.log_level)
+
+    configure_http_session(
+        pool_size=args.http_pool_size,
+        connect_timeout=args.http_connect_timeout,
+        read_timeout=args.http_read_timeout,
+        retries=args.http_retries,
+        max_concurrency=args.http_max_concurrency
+    )
+
+    if args.subcommand == 'serve':
+        serve(args)
+        return
+
+    cfg_papi = load_config(file=args.cfg_papi)
+    # in fleet mode, each job has its own config
+    cfg_job = load_config(file=args.cfg_job) if args.subcommand != 'fleet' else None
+
+    papi = PAPIClient(**cfg_papi)
+    run(args, papi, cfg_job)
+
+
+def get_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(allow_abbrev=False)
 
     parser.add_argument('--log-level', action='store', type=str, default='INFO')
     parser.add_argument('--cfg-papi', action='store', type=str, default='papi.json', help='PAPI configuration file')
     parser.add_argument('--cfg-job', action='store', type=str, default='job.json', help='Nomad job configuration file')
+    parser.add_argument('--cache-token', action='store_true', help='persist the PAPI and NVFLARE Dashboard access tokens in the job directory until they expire')
+    parser.add_argument('--profile', action='store_true', help='profile the run (main thread) with cProfile; the stats are written to the job directory')
+    parser.add_argument('--http-pool-size', action='store', type=int, default=10, help='max. number of pooled keep-alive connections per host')
+    parser.add_argument('--http-connect-timeout', action='store', type=float, default=10, help='HTTP connect timeout in seconds')
+    parser.add_argument('--http-read-timeout', action='store', type=float, default=60, help='HTTP read timeout in seconds')
+    parser.add_argument('--http-retries', action='store', type=int, default=3, help='number of retries of HTTP requests failed with a transient error')
+    parser.add_argument('--http-max-concurrency', action='store', type=int, default=32, help='max. number of concurrent HTTP requests per host; the actual limit adapts to the responses of the host; 0 disables the limit')
 
     subparsers = parser.add_subparsers(
         dest='subcommand',
@@ -769,21 +3888,76 @@ if __name__ == "__main__":
 
     job_parser = subparsers.add_parser('job')
     job_parser.add_argument('--start', action='store_true')
+    job_parser.add_argument('--delete', action='store_true', help='stop and remove the client containers of the job and delete the job')
+    job_parser.add_argument('--purge', action='store_true', help='with --delete, also remove the downloaded and extracted startup kits of the job')
+    job_parser.add_argument('--jobid', action='store', type=str, default=os.getenv('NVFL_JOBID', None), help='Nomad job ID, with --delete')
+    job_parser.add_argument('--parallel', action='store', type=int, default=1, help='with --delete, max. number of concurrent docker stop and rm calls')
+    job_parser.add_argument('--wait', action='store_true', help='with --start, wait until the NVFLARE Dashboard and FL server are ready')
+    job_parser.add_argument('--wait-timeout', action='store', type=float, default=1200, help='max. time in seconds to wait for the job endpoints to be ready')
     job_parser.add_argument('--nvflare-dashboard-namespace', action='store', type=str,
                                  default=os.getenv('NVFLARE_DASHBOARD_NAMESPACE', 'nvflare-dashboard'),
                                  help='used since NVFLARE v2.6.0, where the namespace is set to `nvflare-dashboard`')
 
+    def add_scenario_arguments(p):
+        p.add_argument('--nvflare-dashboard-namespace', action='store', type=str,
+                       default=os.getenv('NVFLARE_DASHBOARD_NAMESPACE', 'nvflare-dashboard'),
+                       help='used since NVFLARE v2.6.0, where the namespace is set to `nvflare-dashboard`')
+        p.add_argument('--wait-timeout', action='store', type=float, default=1200, help='max. time in seconds to wait for the job endpoints to be ready')
+        p.add_argument('--parallel', action='store', type=int, default=1, help='max. number of organizations processed, startup kits downloaded and clients started concurrently')
+
+        p.add_argument('--pipeline', action='store_true', help='process each client through the requested phases on its own, instead of phase by phase')
+        p.add_argument('--stage-parallel', action='store', type=str, default=None,
+                       help='with --pipeline, max. concurrency per stage, e.g. `create=2,download=8`; stages: org, create, approve, download, extract, launch')
+
+        g = p.add_argument_group()
+        g.add_argument('--init', action='store_true')
+        g.add_argument('--reconcile', action='store_true', help='with --init, create and approve only the users and clients missing in the NVFLARE Dashboard')
+        g.add_argument('--download', action='store_true')
+        g.add_argument('--force-download', action='store_true', help='with --download, download all startup kits again, also those whose NVFLARE Dashboard record did not change since the last download')
+        g.add_argument('--start', action='store_true')
+        g.add_argument('--admit-timeout', action='store', type=float, default=0,
+                       help='with --start and client resources in the scenario, max. time in seconds to wait for running clients to free the host for the next wave')
+
     scenario_parser = subparsers.add_parser('scenario')
     scenario_parser.add_argument('--jobid', action='store', type=str, default=os.getenv('NVFL_JOBID', None), help='Nomad job ID')
     scenario_parser.add_argument('--cfg', action='store', type=str, default='scenario.json', help='scenario configuration file')
-    scenario_parser.add_argument('--nvflare-dashboard-namespace', action='store', type=str,
-                   default=os.getenv('NVFLARE_DASHBOARD_NAMESPACE', 'nvflare-dashboard'),
-                   help='used since NVFLARE v2.6.0, where the namespace is set to `nvflare-dashboard`')
+    add_scenario_arguments(scenario_parser)
+    scenario_parser.add_argument('--stop', action='store_true', help='before the other phases, stop and remove all client containers of the job')
+    scenario_parser.add_argument('--purge', action='store_true', help='as --stop, and also remove the downloaded and extracted startup kits of the job')
+    scenario_parser.add_argument('--watch', action='store_true', help='after the other phases, keep watching the client containers and restart the crashed ones until interrupted')
+    scenario_parser.add_argument('--watch-interval', action='store', type=float, default=10, help='with --watch, seconds between two checks of the containers')
+    scenario_parser.add_argument('--watch-max-backoff', action='store', type=float, default=300, help='with --watch, max. delay in seconds before restarting a client that keeps crashing')
+    scenario_parser.add_argument('--watch-flap-limit', action='store', type=int, default=5,
+                                 help=f'with --watch, a client restarted this many times within {ClientWatcher.FLAP_WINDOW}s is flagged as flapping and not restarted again')
+    scenario_parser.add_argument('--watch-duration', action='store', type=float, default=None, help='with --watch, stop watching after this many seconds; default: until interrupted')
+
+    fleet_parser = subparsers.add_parser('fleet')
+    fleet_parser.add_argument('--cfg', action='store', type=str, default='fleet.json', help='fleet configuration file, a list of jobs with their job and scenario configuration files')
+    fleet_parser.add_argument('--index', action='store', type=str, default=None, help='index of the deployed jobs and their endpoints; default: NVFL_JOBS_DIR/fleet.json')
+    fleet_parser.add_argument('--fleet-parallel', action='store', type=int, default=None, help='max. number of jobs deployed and provisioned concurrently; default: all')
+    fleet_parser.add_argument('--wait', action='store_true', help='wait until the jobs without a scenario (or without --init, --download, --start) are ready')
+    add_scenario_arguments(fleet_parser)
+
+    submit_parser = subparsers.add_parser('submit', help='validate, package and submit FL apps to the FL server of the job with the FLARE console credentials')
+    submit_parser.add_argument('apps', nargs='*', help='names of the FL apps in --apps-dir, or their paths; default: all apps in --apps-dir')
+    submit_parser.add_argument('--jobid', action='store', type=str, default=os.getenv('NVFL_JOBID', None), help='Nomad job ID')
+    submit_parser.add_argument('--cfg', action='store', type=str, default='scenario.json', help='scenario configuration file the sites of the apps are checked against, if it exists')
+    submit_parser.add_argument('--apps-dir', action='store', type=str, default='fl_apps', help='directory of the FL apps')
+    submit_parser.add_argument('--repeat', action='store', type=int, default=1, help='number of FLARE jobs submitted for each app')
+    submit_parser.add_argument('--wait', action='store_true', help='wait until the submitted FLARE jobs are finished')
+    submit_parser.add_argument('--wait-timeout', action='store', type=float, default=None, help='with --wait, max. time in seconds to wait; default: no limit')
+    submit_parser.add_argument('--poll-interval', action='store', type=float, default=5, help='with --wait, initial seconds between two checks of the FLARE job status')
+    submit_parser.add_argument('--poll-max-interval', action='store', type=float, default=60, help='with --wait, max. seconds between two checks while no status changes')
+    submit_parser.add_argument('--flare-timeout', action='store', type=float, default=10, help='timeout in seconds of the FLARE admin API connection')
+
+    serve_parser = subparsers.add_parser('serve', help='keep sessions, tokens and endpoints warm and run the commands sent by tool_nvflare_client.py')
+    serve_parser.add_argument('--socket', action='store', type=str, default=None, help='Unix socket to listen on; default: NVFL_SOCKET or NVFL_JOBS_DIR/.tool-nvflare.sock')
+    serve_parser.add_argument('--directory-max-age', action='store', type=float, default=30, help='max. age in seconds of the cached NVFLARE Dashboard users and clients listings')
+
+    return parser
 
-    g = scenario_parser.add_argument_group()
-    g.add_argument('--init', action='store_true')
-    g.add_argument('--download', action='store_true')
-    g.add_argument('--start', action='store_true')
 
-    args = parser.parse_args()
+if __name__ == "__main__":
+
+    args = get_parser().parse_args()
     main(args)
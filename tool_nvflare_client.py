@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# Thin client of `tool_nvflare.py serve`: sends the command line to the server and prints its output.
+# Only the standard library is imported, so starting it costs a few milliseconds.
+import json
+import os
+import socket
+import sys
+
+# keep in sync with SERVE_ENV in tool_nvflare.py
+SERVE_ENV = ['NVFL_JOBS_DIR', 'NVFL_JOBID', 'NVFLARE_DASHBOARD_NAMESPACE']
+
+
+def get_socket_file() -> str:
+    jobs_dir = os.environ.get('NVFL_JOBS_DIR', os.path.join(os.path.curdir, 'jobs'))
+    return os.getenv('NVFL_SOCKET', os.path.join(jobs_dir, '.tool-nvflare.sock'))
+
+
+def main(argv: list) -> int:
+    if argv == ['--shutdown']:
+        request = {'shutdown': True}
+    else:
+        request = {
+            'argv': argv,
+            'cwd': os.getcwd(),
+            'env': {name: os.environ[name] for name in SERVE_ENV if name in os.environ}
+        }
+    socket_file = get_socket_file()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_file)
+        except OSError as e:
+            print(f'could not connect to {socket_file}, is `tool_nvflare.py serve` running? {e}', file=sys.stderr, flush=True)
+            return 1
+        sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        for line in sock.makefile('r', encoding='utf-8'):
+            msg = json.loads(line)
+            if 'out' in msg:
+                sys.stdout.write(msg['out'])
+                sys.stdout.flush()
+            if 'exit' in msg:
+                return msg['exit']
+    print('connection closed by the server', file=sys.stderr, flush=True)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))